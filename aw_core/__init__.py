@@ -10,14 +10,18 @@ from . import config
 from . import log
 
 from . import models
-from .models import Event
+from .models import Event, CompactEvent, EventBatch, SortedEvents
 
 from . import schema
+from . import heartbeats
 
 __all__ = [
     "__about__",
     # Classes
     "Event",
+    "CompactEvent",
+    "EventBatch",
+    "SortedEvents",
     # Modules
     "decorators",
     "util",
@@ -26,4 +30,5 @@ __all__ = [
     "log",
     "models",
     "schema",
+    "heartbeats",
 ]
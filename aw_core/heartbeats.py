@@ -0,0 +1,86 @@
+import logging
+from copy import copy
+from datetime import timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .models import Event, EventBatch, timestamp_to_us
+
+logger = logging.getLogger(__name__)
+
+_TD_1US = timedelta(microseconds=1)
+
+NEGATIVE_DURATION_WARNING = (
+    "Merging heartbeats would result in a negative duration, refusing to merge."
+)
+
+
+def _reduce_runs(
+    heartbeats: Iterable[Tuple[int, int, dict, Event]], pulsetime: float
+) -> Iterator[Tuple[Event, Optional[int]]]:
+    """
+    Takes the start and end (in microseconds) and data of each event, and
+    yields the first event of each run of merged heartbeats along with the
+    merged duration (in microseconds) of the run, or None if nothing was
+    merged into it.
+    """
+    pulse = timedelta(seconds=pulsetime) // _TD_1US
+    it = iter(heartbeats)
+    first = next(it, None)
+    if first is None:
+        return
+    start, end, data, event = first
+    duration = end - start
+    merged = False
+    for hb_start, hb_end, hb_data, heartbeat in it:
+        # Interned payloads (such as from storages) are shared between events,
+        # so are often the very same object
+        if (
+            hb_data is data or hb_data == data
+        ) and start <= hb_start <= start + duration + pulse:
+            if duration >= 0:
+                # Taking the max ensures heartbeats that end before the run don't shorten it
+                new_duration = hb_end - start
+                if new_duration > duration:
+                    duration = new_duration
+                merged = True
+                continue
+            logger.warning(NEGATIVE_DURATION_WARNING)
+        yield event, duration if merged else None
+        start, duration, data, event = hb_start, hb_end - hb_start, hb_data, heartbeat
+        merged = False
+    yield event, duration if merged else None
+
+
+def _reduced(runs: Iterable[Tuple[Event, Optional[int]]]) -> Iterator[Event]:
+    for event, duration in runs:
+        event = copy(event)
+        if duration is not None:
+            event.duration = timedelta(microseconds=duration)
+        yield event
+
+
+def iter_heartbeat_reduce(events: Iterable[Event], pulsetime: float) -> Iterator[Event]:
+    """
+    Generator version of :func:`heartbeat_reduce`, which yields each merged
+    event as soon as the first heartbeat after it has been seen.
+    """
+    return _reduced(_reduce_runs(_iter_heartbeats(events), pulsetime))
+
+
+def _iter_heartbeats(events: Iterable[Event]) -> Iterator[Tuple[int, int, dict, Event]]:
+    for e in events:
+        start = timestamp_to_us(e.timestamp)
+        yield start, start + e.duration // _TD_1US, e.data, e
+
+
+def heartbeat_reduce(events: List[Event], pulsetime: float) -> List[Event]:
+    """
+    Merges consecutive events together according to the rules of
+    ``aw_transform.heartbeat_merge``.
+
+    The events are merged on their times in microseconds, which makes it fast
+    enough to replay large amounts of raw heartbeats.
+    """
+    batch = EventBatch.from_events(events)
+    heartbeats = zip(batch.starts, batch.ends, batch.data, events)
+    return list(_reduced(_reduce_runs(heartbeats, pulsetime)))
@@ -2,16 +2,29 @@ import json
 import logging
 import numbers
 import typing
+from array import array
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import islice
 from typing import (
     Any,
     Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
     Optional,
+    Tuple,
     Union,
 )
 
 import iso8601
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,16 +34,58 @@ ConvertibleTimestamp = Union[datetime, str]
 Duration = Union[timedelta, Number]
 Data = Dict[str, Any]
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TD_1US = timedelta(microseconds=1)
+
+# Number of parsed timestamp strings to keep around, timestamps repeat a lot
+# when the same events are sent multiple times (heartbeats, re-imports)
+TIMESTAMP_CACHE_SIZE = 1024
+
+
+def timestamp_to_us(ts: datetime) -> int:
+    """Returns a timezone-aware datetime as integer microseconds since the unix epoch"""
+    return (ts - EPOCH) // _TD_1US
+
+
+def us_to_timestamp(us: int) -> datetime:
+    """Returns integer microseconds since the unix epoch as a UTC datetime"""
+    return EPOCH + timedelta(microseconds=us)
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _parse_timestamp_str(ts_in: str) -> datetime:
+    """
+    Parses an ISO8601 timestamp string into a UTC datetime with millisecond resolution.
+
+    Tries the (much faster) datetime.fromisoformat first, which handles the
+    canonical format we serialize to, and falls back to iso8601 for anything it
+    rejects or can't give a timezone for.
+    """
+    try:
+        ts = datetime.fromisoformat(ts_in)
+    except ValueError:
+        ts = None
+    if ts is None or ts.tzinfo is None:
+        ts = iso8601.parse_date(ts_in)
+    if ts.microsecond % 1000:
+        ts = ts.replace(microsecond=ts.microsecond - ts.microsecond % 1000)
+    if ts.tzinfo is not timezone.utc:
+        ts = ts.astimezone(timezone.utc)
+    return ts
+
 
 def _timestamp_parse(ts_in: ConvertibleTimestamp) -> datetime:
     """
     Takes something representing a timestamp and
     returns a timestamp in the representation we want.
     """
-    ts = iso8601.parse_date(ts_in) if isinstance(ts_in, str) else ts_in
+    if isinstance(ts_in, str):
+        return _parse_timestamp_str(ts_in)
+    ts = ts_in
     # Set resolution to milliseconds instead of microseconds
     # (Fixes incompability with software based on unix time, for example mongodb)
-    ts = ts.replace(microsecond=int(ts.microsecond / 1000) * 1000)
+    if ts.microsecond % 1000:
+        ts = ts.replace(microsecond=ts.microsecond - ts.microsecond % 1000)
     # Add timezone if not set
     if not ts.tzinfo:
         # Needed? All timestamps should be iso8601 so ought to always contain timezone.
@@ -61,14 +116,38 @@ class Event(dict):
             # FIXME: The typing.cast here was required for mypy to shut up, weird...
             self.timestamp = datetime.now(typing.cast(timezone, timezone.utc))
         else:
-            # The conversion needs to be explicit here for mypy to pick it up
-            # (lacks support for properties)
-            self.timestamp = _timestamp_parse(timestamp)
+            self.timestamp = timestamp  # type: ignore
         self.duration = duration  # type: ignore
         self.data = data
 
+    @classmethod
+    def from_normalized(
+        cls,
+        id: Id,
+        timestamp: datetime,
+        duration: timedelta,
+        data: Data,
+    ) -> "Event":
+        """
+        Fast constructor for values already in the representation we want,
+        as produced by storages: a UTC datetime at millisecond resolution and a timedelta.
+        Falls back to the regular (parsing) constructor for anything else.
+        """
+        if (
+            timestamp.tzinfo is not timezone.utc
+            or timestamp.microsecond % 1000
+            or type(duration) is not timedelta
+        ):
+            return cls(id=id, timestamp=timestamp, duration=duration, data=data)
+        e = dict.__new__(cls)
+        e["id"] = id
+        e["timestamp"] = timestamp
+        e["duration"] = duration
+        e["data"] = data
+        return e
+
     def __eq__(self, other: object) -> bool:
-        if isinstance(other, Event):
+        if isinstance(other, (Event, CompactEvent)):
             return (
                 self.timestamp == other.timestamp
                 and self.duration == other.duration
@@ -82,7 +161,7 @@ class Event(dict):
             )
 
     def __lt__(self, other: object) -> bool:
-        if isinstance(other, Event):
+        if isinstance(other, (Event, CompactEvent)):
             return self.timestamp < other.timestamp
         else:
             raise TypeError(
@@ -91,6 +170,12 @@ class Event(dict):
                 )
             )
 
+    def __copy__(self) -> "Event":
+        # Shallow copy, the data dict is shared with the original
+        e = dict.__new__(type(self))
+        dict.update(e, self)
+        return e
+
     def to_json_dict(self) -> dict:
         """Useful when sending data over the wire.
         Any mongodb interop should not use do this as it accepts datetimes."""
@@ -130,7 +215,10 @@ class Event(dict):
 
     @timestamp.setter
     def timestamp(self, timestamp: ConvertibleTimestamp) -> None:
-        self["timestamp"] = _timestamp_parse(timestamp).astimezone(timezone.utc)
+        ts = _timestamp_parse(timestamp)
+        if ts.tzinfo is not timezone.utc:
+            ts = ts.astimezone(timezone.utc)
+        self["timestamp"] = ts
 
     @property
     def duration(self) -> timedelta:
@@ -144,3 +232,427 @@ class Event(dict):
             self["duration"] = timedelta(seconds=duration)  # type: ignore
         else:
             raise TypeError(f"Couldn't parse duration of invalid type {type(duration)}")
+
+
+class CompactEvent:
+    """
+    Lightweight alternative to :class:`Event`, with the timestamp and duration
+    stored as integer microseconds (``start_us`` and ``duration_us``).
+
+    Uses a fraction of the memory of an Event. It has the same attribute interface
+    (converting on access), so it can be passed to the functions in aw_transform,
+    while functions working on the integer times can skip datetime arithmetic.
+    """
+
+    __slots__ = ("id", "start_us", "duration_us", "data")
+
+    def __init__(
+        self,
+        id: Id = None,
+        start_us: int = 0,
+        duration_us: int = 0,
+        data: Optional[Data] = None,
+    ) -> None:
+        self.id = id
+        self.start_us = start_us
+        self.duration_us = duration_us
+        self.data = data if data is not None else {}
+
+    @classmethod
+    def from_event(cls, event: Event) -> "CompactEvent":
+        return cls(
+            event.id,
+            timestamp_to_us(event.timestamp),
+            event.duration // _TD_1US,
+            event.data,
+        )
+
+    def to_event(self) -> Event:
+        return Event.from_normalized(self.id, self.timestamp, self.duration, self.data)
+
+    @property
+    def end_us(self) -> int:
+        return self.start_us + self.duration_us
+
+    @property
+    def timestamp(self) -> datetime:
+        return us_to_timestamp(self.start_us)
+
+    @timestamp.setter
+    def timestamp(self, timestamp: ConvertibleTimestamp) -> None:
+        self.start_us = timestamp_to_us(_timestamp_parse(timestamp))
+
+    @property
+    def duration(self) -> timedelta:
+        return timedelta(microseconds=self.duration_us)
+
+    @duration.setter
+    def duration(self, duration: Duration) -> None:
+        if isinstance(duration, timedelta):
+            self.duration_us = duration // _TD_1US
+        elif isinstance(duration, numbers.Real):
+            self.duration_us = round(duration * 1000000)
+        else:
+            raise TypeError(f"Couldn't parse duration of invalid type {type(duration)}")
+
+    def __getitem__(self, key: str) -> Any:
+        # Mirrors the dict interface of Event for the keys it has
+        if key in self.__slots__ or key in ("timestamp", "duration"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CompactEvent):
+            return (
+                self.start_us == other.start_us
+                and self.duration_us == other.duration_us
+                and self.data == other.data
+            )
+        elif isinstance(other, Event):
+            return other == self
+        else:
+            raise TypeError(
+                "operator not supported between instances of '{}' and '{}'".format(
+                    type(self), type(other)
+                )
+            )
+
+    def __lt__(self, other: object) -> bool:
+        if isinstance(other, CompactEvent):
+            return self.start_us < other.start_us
+        elif isinstance(other, Event):
+            return self.timestamp < other.timestamp
+        else:
+            raise TypeError(
+                "operator not supported between instances of '{}' and '{}'".format(
+                    type(self), type(other)
+                )
+            )
+
+    def __copy__(self) -> "CompactEvent":
+        return CompactEvent(self.id, self.start_us, self.duration_us, self.data)
+
+    def __repr__(self) -> str:
+        return "<CompactEvent id={} timestamp={} duration={} data={}>".format(
+            self.id, self.timestamp, self.duration, self.data
+        )
+
+    def to_json_dict(self) -> dict:
+        return self.to_event().to_json_dict()
+
+    def to_json_str(self) -> str:
+        return json.dumps(self.to_json_dict())
+
+
+# The orders a SortedEvents can be known to be in, "-" meaning descending
+SORT_ORDERS = ("timestamp", "-timestamp", "-duration")
+
+
+class SortedEvents(list):
+    """
+    A list of events known to be sorted by ``sorted_by`` (one of ``SORT_ORDERS``),
+    such as events from storage (descending by timestamp), so that sorting it
+    again can be skipped.
+
+    Operations returning new lists (slicing, concatenation) return plain lists,
+    so the order is only carried along by functions which know they keep it.
+    It must not be modified in place in ways which break the order.
+    """
+
+    def __init__(self, events: Iterable[Any] = (), sorted_by: str = "timestamp"):
+        if sorted_by not in SORT_ORDERS:
+            raise ValueError(
+                f"Invalid sort order '{sorted_by}', must be one of {SORT_ORDERS}"
+            )
+        super().__init__(events)
+        self.sorted_by = sorted_by
+
+
+def _freeze(value: Any) -> Hashable:
+    """
+    Returns a hashable key for a JSON-like value, such that two values get
+    equal keys exactly when they compare equal.
+    """
+    if isinstance(value, dict):
+        return (dict, frozenset((k, _freeze(v)) for k, v in value.items()))
+    elif isinstance(value, list):
+        return (list, tuple(_freeze(v) for v in value))
+    elif isinstance(value, tuple):
+        return (tuple, tuple(_freeze(v) for v in value))
+    return value
+
+
+def intern_data(datas: Iterable[Data]) -> Tuple[List[int], List[Data]]:
+    """
+    Assigns each distinct data dict a category code.
+
+    Returns the codes (one per input) and the distinct data dicts, such that
+    ``uniques[codes[i]] == datas[i]``. Dicts containing unhashable values which
+    aren't lists or dicts get a category of their own.
+    """
+    codes: List[int] = []
+    uniques: List[Data] = []
+    index: Dict[Hashable, int] = {}
+    # Payloads are often shared between events, so first look them up by
+    # identity (keeping the payload in the value so that its id stays valid)
+    by_identity: Dict[int, Tuple[Data, int]] = {}
+    for data in datas:
+        hit = by_identity.get(id(data))
+        if hit is not None and hit[0] is data:
+            codes.append(hit[1])
+            continue
+        try:
+            # Fast path for flat payloads
+            key: Optional[Hashable] = (dict, frozenset(data.items()))
+        except TypeError:
+            try:
+                key = _freeze(data)
+            except TypeError:
+                key = None
+        code = index.get(key) if key is not None else None
+        if code is None:
+            code = len(uniques)
+            uniques.append(data)
+            if key is not None:
+                index[key] = code
+        by_identity[id(data)] = (data, code)
+        codes.append(code)
+    return codes, uniques
+
+
+class EventBatch:
+    """
+    Columnar container for a list of events.
+
+    Start and end times are kept as integer microseconds since the epoch in
+    int64 arrays (``array("q")``), with ids and data in parallel lists. The
+    arrays support the buffer protocol, so they can be wrapped by e.g.
+    ``numpy.frombuffer`` without copying.
+
+    Converts losslessly to and from a list of :class:`Event` (or
+    :class:`CompactEvent`).
+    """
+
+    __slots__ = ("ids", "starts", "ends", "data")
+
+    def __init__(
+        self,
+        ids: Optional[List[Id]] = None,
+        starts: Optional[Iterable[int]] = None,
+        ends: Optional[Iterable[int]] = None,
+        data: Optional[List[Data]] = None,
+    ) -> None:
+        self.ids: List[Id] = ids if ids is not None else []
+        self.starts = array("q", starts if starts is not None else [])
+        self.ends = array("q", ends if ends is not None else [])
+        self.data: List[Data] = data if data is not None else []
+        if not (len(self.ids) == len(self.starts) == len(self.ends) == len(self.data)):
+            raise ValueError("All columns of an EventBatch must have the same length")
+
+    @classmethod
+    def from_events(cls, events: Iterable[Union[Event, CompactEvent]]) -> "EventBatch":
+        events = list(events)
+        if all(type(e) is Event for e in events):
+            # Read the dicts directly instead of going through the properties,
+            # falling back to the properties if any field is unset
+            try:
+                starts = [(e["timestamp"] - EPOCH) // _TD_1US for e in events]
+                durations = [e["duration"] // _TD_1US for e in events]
+                data = [e["data"] for e in events]
+                ids = [e["id"] for e in events]
+            except (KeyError, TypeError):
+                pass
+            else:
+                if any(d is None for d in data):
+                    data = [d if d is not None else {} for d in data]
+                ends = [s + d for s, d in zip(starts, durations)]
+                return cls(ids, starts, ends, data)
+        elif all(type(e) is CompactEvent for e in events):
+            compact = typing.cast(List[CompactEvent], events)
+            return cls(
+                [e.id for e in compact],
+                [e.start_us for e in compact],
+                [e.start_us + e.duration_us for e in compact],
+                [e.data for e in compact],
+            )
+
+        batch = cls()
+        for e in events:
+            if isinstance(e, CompactEvent):
+                start = e.start_us
+                end = start + e.duration_us
+            else:
+                start = timestamp_to_us(e.timestamp)
+                end = start + e.duration // _TD_1US
+            batch.ids.append(e.id)
+            batch.starts.append(start)
+            batch.ends.append(end)
+            batch.data.append(e.data)
+        return batch
+
+    def to_events(self) -> List[Event]:
+        return list(self)
+
+    def to_compact(self) -> List[CompactEvent]:
+        return [
+            CompactEvent(id, start, end - start, data)
+            for id, start, end, data in zip(self.ids, self.starts, self.ends, self.data)
+        ]
+
+    @property
+    def durations(self) -> array:
+        return array("q", (end - start for start, end in zip(self.starts, self.ends)))
+
+    def intern_data(self) -> Tuple[List[int], List[Data]]:
+        """Returns category codes and distinct values for the data column, see :func:`intern_data`"""
+        return intern_data(self.data)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Event]:
+        from_normalized = Event.from_normalized
+        for id, start, end, data in zip(self.ids, self.starts, self.ends, self.data):
+            yield from_normalized(
+                id,
+                us_to_timestamp(start),
+                timedelta(microseconds=end - start),
+                data,
+            )
+
+    def __repr__(self) -> str:
+        return f"<EventBatch len={len(self)}>"
+
+
+# Number of events serialized at a time by iter_events_json
+JSON_CHUNK_SIZE = 1000
+
+_json_encode = json.JSONEncoder(separators=(",", ":")).encode
+# Same as the json module uses for (finite) floats
+_float_repr = float.__repr__
+
+
+def _event_fields(
+    e: Union[Event, CompactEvent],
+) -> Optional[Tuple[Id, datetime, float, Data]]:
+    """Returns the (id, timestamp, duration, data) of an event with only the standard fields"""
+    if isinstance(e, CompactEvent):
+        return e.id, e.timestamp, e.duration_us / 1000000, e.data
+    elif len(e) == 4 and e.get("duration") is not None:
+        return e["id"], e["timestamp"], e["duration"].total_seconds(), e["data"]
+    return None
+
+
+def _chunk_to_json_orjson(events: List[Union[Event, CompactEvent]]) -> bytes:
+    objs: List[dict] = []
+    for e in events:
+        fields = _event_fields(e)
+        if fields is None:
+            objs.append(e.to_json_dict())
+        else:
+            event_id, timestamp, duration, data = fields
+            objs.append(
+                {
+                    "id": event_id,
+                    "timestamp": timestamp,
+                    "duration": duration,
+                    "data": data,
+                }
+            )
+    # Strip the brackets, the chunks are joined into a single array
+    return orjson.dumps(objs)[1:-1]
+
+
+# Types of values whose equality means they serialize the same, given the type
+_KEYABLE_TYPES = (str, int, bool, type(None))
+
+
+def _payload_key(data: Data) -> Optional[Tuple]:
+    """
+    Returns a key for caching the serialization of a flat payload by content,
+    or None for other payloads.
+
+    The type of each value is part of the key, since e.g. ``1 == 1.0 == True``.
+    Floats are keyed by their repr, as ``0.0 == -0.0``.
+    """
+    key = []
+    for k, v in data.items():
+        t = type(v)
+        if t is float:
+            v = _float_repr(v)
+        elif t not in _KEYABLE_TYPES or type(k) is not str:
+            return None
+        key.append((k, t, v))
+    return tuple(key)
+
+
+def _chunk_to_json_stdlib(
+    events: List[Union[Event, CompactEvent]], data_cache: Dict[Any, Tuple[Data, str]]
+) -> bytes:
+    parts: List[str] = []
+    for e in events:
+        fields = _event_fields(e)
+        if fields is None:
+            parts.append(_json_encode(e.to_json_dict()))
+            continue
+        event_id, timestamp, duration, data = fields
+        # Cache serialized payloads by identity, and by content for flat payloads.
+        # The payload itself is kept in the value so that its id can't be reused.
+        cached = data_cache.get(id(data))
+        if cached is None or cached[0] is not data:
+            key = _payload_key(data)
+            cached = data_cache.get(key) if key is not None else None
+            if cached is None:
+                cached = (data, _json_encode(data))
+                if key is not None:
+                    data_cache[key] = cached
+            data_cache[id(data)] = cached
+        parts.append(
+            '{"id":%s,"timestamp":"%s","duration":%s,"data":%s}'
+            % (
+                event_id if type(event_id) is int else _json_encode(event_id),
+                timestamp.isoformat(),
+                _float_repr(duration),
+                cached[1],
+            )
+        )
+    return ",".join(parts).encode("utf-8")
+
+
+def iter_events_json(events: Iterable[Union[Event, CompactEvent]]) -> Iterator[bytes]:
+    """
+    Serializes events as a JSON array, yielding it in chunks of bytes so that
+    large responses can be streamed without building the whole array in memory.
+
+    The output is the same as a list of :meth:`Event.to_json_dict` would give.
+    Uses orjson when it is installed, otherwise the stdlib json module with
+    serialized payloads cached for repeated data dicts.
+    """
+    data_cache: Dict[Any, Tuple[Data, str]] = {}
+    yield b"["
+    first = True
+    it = iter(events)
+    while True:
+        chunk = list(islice(it, JSON_CHUNK_SIZE))
+        if not chunk:
+            break
+        encoded = None
+        if orjson is not None:
+            try:
+                encoded = _chunk_to_json_orjson(chunk)
+            except TypeError:
+                # Something orjson doesn't support, such as non-str keys
+                pass
+        if encoded is None:
+            encoded = _chunk_to_json_stdlib(chunk, data_cache)
+        if first:
+            first = False
+            yield encoded
+        else:
+            yield b"," + encoded
+    yield b"]"
+
+
+def events_to_json(events: Iterable[Union[Event, CompactEvent]]) -> bytes:
+    """Serializes events as a JSON array, see :func:`iter_events_json`"""
+    return b"".join(iter_events_json(events))
@@ -1,14 +1,18 @@
 import logging
 from datetime import datetime, timedelta, timezone
 from typing import (
+    Any,
     Callable,
     Dict,
     List,
     Optional,
+    Sequence,
+    Tuple,
     Union,
 )
 
-from aw_core.models import Event
+from aw_core.heartbeats import heartbeat_reduce
+from aw_core.models import Event, EventBatch, SortedEvents
 
 from .storages import AbstractStorage
 
@@ -95,6 +99,44 @@ class Bucket:
         endtime: Optional[datetime] = None,
     ) -> List[Event]:
         """Returns events sorted in descending order by timestamp"""
+        starttime, endtime = self._round_range(starttime, endtime)
+        events = self.ds.storage_strategy.get_events(
+            self.bucket_id, limit, starttime, endtime
+        )
+        events_order = self.ds.storage_strategy.events_order
+        return SortedEvents(events, events_order) if events_order else events
+
+    def get_batch(
+        self,
+        limit: int = -1,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+    ) -> EventBatch:
+        """Same as get, but returns the events as a columnar EventBatch"""
+        starttime, endtime = self._round_range(starttime, endtime)
+        return self.ds.storage_strategy.get_events_batch(
+            self.bucket_id, limit, starttime, endtime
+        )
+
+    def get_periods(
+        self,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+        key: Optional[str] = None,
+    ) -> Tuple[Sequence[int], Sequence[int], Optional[List[Any]]]:
+        """
+        Returns the start and end times (in microseconds) of the events, along
+        with the value for the key in their data if one is given.
+        """
+        starttime, endtime = self._round_range(starttime, endtime)
+        return self.ds.storage_strategy.get_event_periods(
+            self.bucket_id, starttime, endtime, key
+        )
+
+    @staticmethod
+    def _round_range(
+        starttime: Optional[datetime], endtime: Optional[datetime]
+    ) -> Tuple[Optional[datetime], Optional[datetime]]:
         # Resolution is rounded down since not all datastores like microsecond precision
         if starttime:
             starttime = starttime.replace(
@@ -112,9 +154,7 @@ class Bucket:
                 seconds=second_offset
             )
 
-        return self.ds.storage_strategy.get_events(
-            self.bucket_id, limit, starttime, endtime
-        )
+        return starttime, endtime
 
     def get_by_id(self, event_id) -> Optional[Event]:
         """Will return the event with the provided ID, or None if not found."""
@@ -127,12 +167,25 @@ class Bucket:
             self.bucket_id, starttime, endtime
         )
 
-    def insert(self, events: Union[Event, List[Event]]) -> Optional[Event]:
+    def insert(
+        self,
+        events: Union[Event, List[Event]],
+        heartbeat_pulsetime: Optional[float] = None,
+    ) -> Optional[Event]:
         """
         Inserts one or several events.
         If a single event is inserted, return the event with its id assigned.
         If several events are inserted, returns None. (This is due to there being no efficient way of getting ids out when doing bulk inserts with some datastores such as peewee/SQLite)
+
+        If ``heartbeat_pulsetime`` is given, several events are first merged as
+        heartbeats with that pulsetime (see ``aw_core.heartbeats.heartbeat_reduce``),
+        which is useful when re-ingesting raw heartbeats. It isn't supported
+        for a single event, which is never merged with the events already stored.
         """
+        if heartbeat_pulsetime is not None and not isinstance(events, list):
+            raise ValueError(
+                "heartbeat_pulsetime is only supported when inserting a list of events"
+            )
 
         # NOTE: Should we keep the timestamp checking?
         warn_older_event = False
@@ -160,6 +213,8 @@ class Bucket:
             inserted = self.ds.storage_strategy.insert_one(self.bucket_id, events)
             # assert inserted
         elif isinstance(events, list):
+            if heartbeat_pulsetime is not None:
+                events = heartbeat_reduce(events, heartbeat_pulsetime)
             if events:
                 oldest_event = sorted(events, key=lambda k: k["timestamp"])[0]
             else:  # pragma: no cover
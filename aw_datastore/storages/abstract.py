@@ -1,8 +1,8 @@
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from aw_core.models import Event
+from aw_core.models import Event, EventBatch
 
 
 class AbstractStorage(metaclass=ABCMeta):
@@ -12,6 +12,10 @@ class AbstractStorage(metaclass=ABCMeta):
 
     sid = "Storage id not set, fix me"
 
+    # The order of the events returned by get_events if it's known, as a sort
+    # order of aw_core.models.SortedEvents (e.g. "-timestamp" for descending)
+    events_order: Optional[str] = None
+
     @abstractmethod
     def __init__(self, testing: bool) -> None:
         self.testing = True
@@ -72,6 +76,35 @@ class AbstractStorage(metaclass=ABCMeta):
     ) -> List[Event]:
         raise NotImplementedError
 
+    def get_events_batch(
+        self,
+        bucket_id: str,
+        limit: int,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+    ) -> EventBatch:
+        """Same as get_events, but returns the events as a columnar EventBatch"""
+        return EventBatch.from_events(
+            self.get_events(bucket_id, limit, starttime, endtime)
+        )
+
+    def get_event_periods(
+        self,
+        bucket_id: str,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+        key: Optional[str] = None,
+    ) -> Tuple[Sequence[int], Sequence[int], Optional[List[Any]]]:
+        """
+        Returns the start and end times (in microseconds) of the events in the
+        range, along with the value for the key in their data if one is given.
+
+        Storages can override this to avoid decoding whole events.
+        """
+        batch = self.get_events_batch(bucket_id, -1, starttime, endtime)
+        values = [data.get(key) for data in batch.data] if key is not None else None
+        return batch.starts, batch.ends, values
+
     def get_eventcount(
         self,
         bucket_id: str,
@@ -1,23 +1,117 @@
 import copy
 import sys
-from datetime import datetime
-from typing import Dict, List, Optional
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
 
-from aw_core.models import Event
+from aw_core.models import Event, Id, timestamp_to_us as _us
 
 from . import logger
 from .abstract import AbstractStorage
 
+_TD_1US = timedelta(microseconds=1)
+
+
+class _BucketEvents:
+    """
+    The events of a single bucket, kept sorted by timestamp.
+
+    Start and end times are stored as columnar arrays of microseconds (in the same
+    order as ids), so range queries are binary searches instead of full scans.
+    """
+
+    def __init__(self) -> None:
+        self.starts = array("q")
+        self.ends = array("q")
+        self.ids: List[Id] = []
+        self.events: Dict[Id, Event] = {}
+        # Start time each event was indexed with (callers may mutate stored events)
+        self.start_by_id: Dict[Id, int] = {}
+        self.next_id = 0
+        # Longest event duration, lets range queries bisect on starts alone.
+        # The number of events with each duration is kept so that it can be
+        # lowered again when the longest event is removed.
+        self.max_duration = 0
+        self.duration_counts: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, event: Event) -> None:
+        """Adds an event which already has its id set"""
+        start = _us(event.timestamp)
+        duration = event.duration // _TD_1US
+        # Events mostly arrive in order, in which case this is an append
+        idx = bisect_right(self.starts, start)
+        self.starts.insert(idx, start)
+        self.ends.insert(idx, start + duration)
+        self.ids.insert(idx, event.id)
+        self.events[event.id] = event
+        self.start_by_id[event.id] = start
+        self.duration_counts[duration] = self.duration_counts.get(duration, 0) + 1
+        self.max_duration = max(self.max_duration, duration)
+
+    def remove(self, event_id) -> bool:
+        idx = self._index(event_id)
+        if idx is None:
+            return False
+        duration = self.ends[idx] - self.starts[idx]
+        if self.duration_counts[duration] > 1:
+            self.duration_counts[duration] -= 1
+        else:
+            del self.duration_counts[duration]
+            if duration == self.max_duration:
+                self.max_duration = max(0, max(self.duration_counts, default=0))
+        del self.starts[idx]
+        del self.ends[idx]
+        del self.ids[idx]
+        del self.events[event_id]
+        del self.start_by_id[event_id]
+        return True
+
+    def last(self) -> Event:
+        return self.events[self.ids[-1]]
+
+    def in_range(
+        self, starttime: Optional[datetime], endtime: Optional[datetime]
+    ) -> Iterator[Event]:
+        """Yields events intersecting the range, in descending order by timestamp"""
+        lo = 0
+        if starttime:
+            start = _us(starttime)
+            lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_right(self.starts, _us(endtime)) if endtime else len(self.ids)
+        for idx in range(hi - 1, lo - 1, -1):
+            if not starttime or start <= self.ends[idx]:
+                yield self.events[self.ids[idx]]
+
+    def count(self, starttime: Optional[datetime], endtime: Optional[datetime]) -> int:
+        """Number of events with a timestamp within the range"""
+        lo = bisect_left(self.starts, _us(starttime)) if starttime else 0
+        hi = bisect_right(self.starts, _us(endtime)) if endtime else len(self.ids)
+        return max(hi - lo, 0)
+
+    def _index(self, event_id) -> Optional[int]:
+        start = self.start_by_id.get(event_id)
+        if start is None:
+            return None
+        idx = bisect_left(self.starts, start)
+        while self.ids[idx] != event_id:
+            idx += 1
+        return idx
+
 
 class MemoryStorage(AbstractStorage):
     """For storage of data in-memory, useful primarily in testing"""
 
     sid = "memory"
+    events_order = "-timestamp"
 
     def __init__(self, testing: bool) -> None:
         self.logger = logger.getChild(self.sid)
         # self.logger.warning("Using in-memory storage, any events stored will not be persistent and will be lost when server is shut down. Use the --storage parameter to set a different storage method.")
-        self.db: Dict[str, List[Event]] = {}
+        self.db: Dict[str, _BucketEvents] = {}
         self._metadata: Dict[str, dict] = dict()
 
     def create_bucket(
@@ -41,7 +135,7 @@ class MemoryStorage(AbstractStorage):
             "created": created,
             "data": data or {},
         }
-        self.db[bucket_id] = []
+        self.db[bucket_id] = _BucketEvents()
 
     def update_bucket(
         self,
@@ -95,23 +189,16 @@ class MemoryStorage(AbstractStorage):
         starttime: Optional[datetime] = None,
         endtime: Optional[datetime] = None,
     ) -> List[Event]:
-        events = self.db[bucket]
-
-        # Sort by timestamp
-        events = sorted(events, key=lambda k: k["timestamp"])[::-1]
-
-        # Filter by date
-        if starttime:
-            events = [e for e in events if starttime <= (e.timestamp + e.duration)]
-        if endtime:
-            events = [e for e in events if e.timestamp <= endtime]
-
         # Limit
         if limit == 0:
             return []
         elif limit < 0:
             limit = sys.maxsize
-        events = events[:limit]
+        events = []
+        for event in self.db[bucket].in_range(starttime, endtime):
+            events.append(event)
+            if len(events) >= limit:
+                break
         # Return
         return copy.deepcopy(events)
 
@@ -121,14 +208,7 @@ class MemoryStorage(AbstractStorage):
         starttime: Optional[datetime] = None,
         endtime: Optional[datetime] = None,
     ) -> int:
-        return len(
-            [
-                e
-                for e in self.db[bucket]
-                if (not starttime or starttime <= e.timestamp)
-                and (not endtime or e.timestamp <= endtime)
-            ]
-        )
+        return self.db[bucket].count(starttime, endtime)
 
     def get_metadata(self, bucket_id: str):
         if bucket_id in self._metadata:
@@ -142,46 +222,26 @@ class MemoryStorage(AbstractStorage):
         else:
             # We need to copy the event to avoid setting the ID on the passed event
             event = copy.copy(event)
-            if self.db[bucket]:
-                event.id = max(int(e.id or 0) for e in self.db[bucket]) + 1
-            else:
-                event.id = 0
-            self.db[bucket].append(event)
+            bucket_events = self.db[bucket]
+            event.id = bucket_events.next_id
+            bucket_events.next_id += 1
+            bucket_events.add(event)
         return event
 
     def delete(self, bucket_id, event_id):
-        for idx in (
-            idx
-            for idx, event in reversed(list(enumerate(self.db[bucket_id])))
-            if event.id == event_id
-        ):
-            self.db[bucket_id].pop(idx)
-            return True
-        return False
+        return self.db[bucket_id].remove(event_id)
 
     def _get_event(self, bucket_id, event_id) -> Optional[Event]:
-        events = [
-            event
-            for idx, event in reversed(list(enumerate(self.db[bucket_id])))
-            if event.id == event_id
-        ]
-        if len(events) < 1:
-            return None
-        else:
-            return events[0]
+        return self.db[bucket_id].events.get(event_id)
 
     def replace(self, bucket_id, event_id, event):
-        for idx in (
-            idx
-            for idx, event in reversed(list(enumerate(self.db[bucket_id])))
-            if event.id == event_id
-        ):
+        bucket_events = self.db[bucket_id]
+        if bucket_events.remove(event_id):
             # We need to copy the event to avoid setting the ID on the passed event
             event = copy.copy(event)
             event.id = event_id
-            self.db[bucket_id][idx] = event
+            bucket_events.add(event)
 
     def replace_last(self, bucket_id, event):
-        # NOTE: This does not actually get the most recent event, only the last inserted
-        last = sorted(self.db[bucket_id], key=lambda e: e.timestamp)[-1]
+        last = self.db[bucket_id].last()
         self.replace(bucket_id, last.id, event)
@@ -57,9 +57,47 @@ def auto_migrate(path: str) -> None:
         with db.atomic():
             migrate(migrator.add_column("bucketmodel", "datastr", datastr_field))
 
+    # check if eventmodel has endtime field
+    info = db.execute_sql("PRAGMA table_info(eventmodel)")
+    has_endtime = any(row[1] == "endtime" for row in info)
+
+    if not has_endtime:
+        endtime_field = DateTimeField(null=True)
+        # Done in a single transaction so an interrupted backfill is retried on next start
+        with db.atomic():
+            migrate(migrator.add_column("eventmodel", "endtime", endtime_field))
+            _backfill_endtime(db)
+
+    # Makes range queries an index scan, see PeeweeStorage._where_range
+    db.execute_sql(
+        "CREATE INDEX IF NOT EXISTS eventmodel_bucket_id_endtime "
+        "ON eventmodel (bucket_id, endtime)"
+    )
+
     db.close()
 
 
+def _backfill_endtime(db, batch_size: int = 10000) -> None:
+    """Sets endtime = timestamp + duration for all events, batch_size events at a time"""
+    last_id = 0
+    while True:
+        rows = db.execute_sql(
+            "SELECT id, timestamp, duration FROM eventmodel "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        db.connection().executemany(
+            "UPDATE eventmodel SET endtime = ? WHERE id = ?",
+            [
+                (_endtime(iso8601.parse_date(timestamp), float(duration)), eid)
+                for eid, timestamp, duration in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+
 def chunks(ls, n):
     """Yield successive n-sized chunks from ls.
     From: https://stackoverflow.com/a/312464/965332"""
@@ -67,13 +105,9 @@ def chunks(ls, n):
         yield ls[i : i + n]
 
 
-def dt_plus_duration(dt, duration):
-    # See peewee docs on datemath: https://docs.peewee-orm.com/en/latest/peewee/hacks.html#date-math
-    return peewee.fn.strftime(
-        "%Y-%m-%d %H:%M:%f+00:00",
-        (peewee.fn.julianday(dt) - 2440587.5) * 86400.0 + duration,
-        "unixepoch",
-    )
+def _endtime(timestamp: datetime, duration: float) -> str:
+    # Stored in the same format as DateTimeField stores timestamps, so they compare correctly
+    return str((timestamp + timedelta(seconds=duration)).astimezone(timezone.utc))
 
 
 class BaseModel(Model):
@@ -111,6 +145,8 @@ class EventModel(BaseModel):
     timestamp = DateTimeField(index=True, default=datetime.now)
     duration = DecimalField()
     datastr = CharField()
+    # Materialised timestamp + duration, indexed together with bucket (see auto_migrate)
+    endtime = DateTimeField(null=True)
 
     @classmethod
     def from_event(cls, bucket_key, event: Event):
@@ -120,6 +156,7 @@ class EventModel(BaseModel):
             timestamp=event.timestamp,
             duration=event.duration.total_seconds(),
             datastr=json.dumps(event.data),
+            endtime=event.timestamp + event.duration,
         )
 
     def json(self):
@@ -133,6 +170,7 @@ class EventModel(BaseModel):
 
 class PeeweeStorage(AbstractStorage):
     sid = "peewee"
+    events_order = "-timestamp"
 
     def __init__(self, testing: bool = True, filepath: Optional[str] = None) -> None:
         data_dir = get_data_dir("aw-server")
@@ -260,6 +298,7 @@ class PeeweeStorage(AbstractStorage):
                 "timestamp": event.timestamp,
                 "duration": event.duration.total_seconds(),
                 "datastr": json.dumps(event.data),
+                "endtime": event.timestamp + event.duration,
             }
             for event in events
             if event.id is None
@@ -295,6 +334,7 @@ class PeeweeStorage(AbstractStorage):
         e.timestamp = event.timestamp
         e.duration = event.duration.total_seconds()
         e.datastr = json.dumps(event.data)
+        e.endtime = event.timestamp + event.duration
         e.save()
         event.id = e.id
         return event
@@ -312,6 +352,7 @@ class PeeweeStorage(AbstractStorage):
         e.timestamp = event.timestamp
         e.duration = event.duration.total_seconds()
         e.datastr = json.dumps(event.data)
+        e.endtime = event.timestamp + event.duration
         e.save()
         event.id = e.id
         return event
@@ -337,17 +378,17 @@ class PeeweeStorage(AbstractStorage):
         """
         Fetch events from a certain bucket, optionally from a given range of time.
 
-        Example raw query:
+        Events intersecting the range are returned, using the stored endtime
+        column (see ``_where_range``), such as with the raw query:
 
-            SELECT strftime(
-              "%Y-%m-%d %H:%M:%f+00:00",
-              ((julianday(timestamp) - 2440587.5) * 86400),
-              'unixepoch'
-            )
-            FROM eventmodel
-            WHERE eventmodel.timestamp > '2021-06-20'
+            SELECT * FROM eventmodel
+            WHERE bucket_id = 1
+              AND '2021-06-20 00:00:00+00:00' <= endtime
+              AND timestamp <= '2021-06-21 00:00:00+00:00'
+            ORDER BY timestamp DESC
             LIMIT 10;
 
+        Events partially out of range are trimmed to it.
         """
         if limit == 0:
             return []
@@ -364,7 +405,7 @@ class PeeweeStorage(AbstractStorage):
         events = [Event(**e) for e in list(map(EventModel.json, res))]
 
         # Trim events that are out of range (as done in aw-server-rust)
-        # TODO: Do the same for the other storage methods
+        # TODO: Do the same for MemoryStorage (SqliteStorage trims in SQL)
         for e in events:
             if starttime:
                 if e.timestamp < starttime:
@@ -400,15 +441,8 @@ class PeeweeStorage(AbstractStorage):
             endtime = endtime.astimezone(timezone.utc)
 
         if starttime:
-            # Faster WHERE to speed up slow query below, leads to ~2-3x speedup
-            # We'll assume events aren't >24h
-            q = q.where(starttime - timedelta(hours=24) <= EventModel.timestamp)
-
-            # This can be slow on large databases...
-            # Tried creating various indexes and using SQLite's unlikely() function, but it had no effect
-            q = q.where(
-                starttime <= dt_plus_duration(EventModel.timestamp, EventModel.duration)
-            )
+            # Uses the (bucket, endtime) index
+            q = q.where(starttime <= EventModel.endtime)
         if endtime:
             q = q.where(EventModel.timestamp <= endtime)
 
@@ -1,15 +1,25 @@
+import copy
+import hashlib
 import json
 import logging
 import os
 import sqlite3
+import zlib
+from array import array
 from datetime import datetime, timedelta, timezone
-from typing import Iterable, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from aw_core.dirs import get_data_dir
-from aw_core.models import Event
+from aw_core.models import Event, EventBatch
 
 from .abstract import AbstractStorage
 
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
 logger = logging.getLogger(__name__)
 
 LATEST_VERSION = 1
@@ -17,6 +27,19 @@ LATEST_VERSION = 1
 # The max integer value in SQLite is signed 8 Bytes / 64 bits
 MAX_TIMESTAMP = 2**63 - 1
 
+# Number of rows fetched and decoded at a time when reading events
+ROW_BATCH_SIZE = 1000
+
+# Number of distinct payloads to keep encoded/decoded in memory
+PAYLOAD_CACHE_SIZE = 4096
+
+# Codecs used for the data column of the payloads table
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+COMPRESSION_CODECS = {None: CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
 CREATE_BUCKETS_TABLE = """
     CREATE TABLE IF NOT EXISTS buckets (
         rowid INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -37,10 +60,27 @@ CREATE_EVENTS_TABLE = """
         starttime INTEGER NOT NULL,
         endtime INTEGER NOT NULL,
         datastr TEXT NOT NULL,
-        FOREIGN KEY (bucketrow) REFERENCES buckets(rowid)
+        payloadid INTEGER,
+        FOREIGN KEY (bucketrow) REFERENCES buckets(rowid),
+        FOREIGN KEY (payloadid) REFERENCES payloads(id)
+    )
+"""
+
+# Interned event data, referenced by events.payloadid when payload interning is enabled
+CREATE_PAYLOADS_TABLE = """
+    CREATE TABLE IF NOT EXISTS payloads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hash BLOB UNIQUE NOT NULL,
+        codec INTEGER NOT NULL,
+        data BLOB NOT NULL
     )
 """
 
+# Databases created before payload interning lack the payloadid column
+ADD_EVENTS_PAYLOADID_COLUMN = """
+    ALTER TABLE events ADD COLUMN payloadid INTEGER REFERENCES payloads(id)
+"""
+
 INDEX_BUCKETS_TABLE_ID = """
     CREATE INDEX IF NOT EXISTS event_index_id ON events(id);
 """
@@ -51,28 +91,201 @@ INDEX_EVENTS_TABLE_STARTTIME = """
 INDEX_EVENTS_TABLE_ENDTIME = """
     CREATE INDEX IF NOT EXISTS event_index_endtime ON events(bucketrow, endtime);
 """
+# Used to check whether a payload is still referenced when events are removed
+INDEX_EVENTS_TABLE_PAYLOADID = """
+    CREATE INDEX IF NOT EXISTS event_index_payloadid ON events(payloadid);
+"""
+
+
+class _PayloadStore:
+    """
+    Interns event data into the payloads table, optionally compressed.
+
+    Identical payloads (same JSON string) are stored once and referenced by id,
+    decoded payloads are memoised per id so repeated payloads are only parsed once.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, compression: Optional[str]) -> None:
+        if compression not in COMPRESSION_CODECS:
+            raise ValueError(f"Unknown payload compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd payload compression requires the zstandard package")
+        self.conn = conn
+        self.codec = COMPRESSION_CODECS[compression]
+        self._intern_cached = lru_cache(maxsize=PAYLOAD_CACHE_SIZE)(self._intern)
+        self._load_cached = lru_cache(maxsize=PAYLOAD_CACHE_SIZE)(self._load)
+
+    def intern(self, datastr: str) -> int:
+        """Returns the id of the payload for datastr, inserting it if needed"""
+        return self._intern_cached(datastr)
 
+    def load(self, payload_id: int) -> dict:
+        """Returns a fresh copy of the data stored for payload_id"""
+        data, flat = self._load_cached(payload_id)
+        # Callers are free to mutate the returned data, so never hand out the cached object
+        return dict(data) if flat else copy.deepcopy(data)
 
-def _rows_to_events(rows: Iterable) -> List[Event]:
-    events = []
-    for row in rows:
-        eid = row[0]
-        starttime = datetime.fromtimestamp(row[1] / 1000000, timezone.utc)
-        endtime = datetime.fromtimestamp(row[2] / 1000000, timezone.utc)
-        duration = endtime - starttime
-        data = json.loads(row[3])
-        events.append(Event(id=eid, timestamp=starttime, duration=duration, data=data))
+    def clear_cache(self) -> None:
+        self._intern_cached.cache_clear()
+        self._load_cached.cache_clear()
+
+    def delete_unused(self, payload_ids: Sequence[Optional[int]]) -> None:
+        """
+        Deletes those of payload_ids which are no longer referenced by any event,
+        to be called with the payloads of events which were removed or replaced.
+        """
+        deleted = 0
+        for payload_id in set(payload_ids):
+            if payload_id is None:
+                continue
+            cursor = self.conn.execute(
+                "DELETE FROM payloads WHERE id = ? AND NOT EXISTS "
+                + "(SELECT 1 FROM events WHERE payloadid = ?)",
+                [payload_id, payload_id],
+            )
+            deleted += cursor.rowcount
+        if deleted:
+            # The caches would otherwise hand out ids of payloads which are gone
+            self.clear_cache()
+
+    def _intern(self, datastr: str) -> int:
+        raw = datastr.encode("utf-8")
+        digest = hashlib.sha1(raw).digest()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO payloads(hash, codec, data) VALUES (?, ?, ?)",
+            [digest, self.codec, self._compress(raw)],
+        )
+        row = self.conn.execute(
+            "SELECT id FROM payloads WHERE hash = ?", [digest]
+        ).fetchone()
+        return row[0]
+
+    def _load(self, payload_id: int) -> Tuple[dict, bool]:
+        row = self.conn.execute(
+            "SELECT codec, data FROM payloads WHERE id = ?", [payload_id]
+        ).fetchone()
+        if row is None:
+            raise Exception(f"Payload {payload_id} did not exist")
+        data = json.loads(self._decompress(row[0], row[1]))
+        flat = not any(isinstance(v, (dict, list)) for v in data.values())
+        return data, flat
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == CODEC_ZLIB:
+            return zlib.compress(raw)
+        elif self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor().compress(raw)
+        return raw
+
+    @staticmethod
+    def _decompress(codec: int, blob: bytes) -> bytes:
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(blob)
+        elif codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise Exception(
+                    "zstd compressed payload found but zstandard is missing"
+                )
+            return zstandard.ZstdDecompressor().decompress(blob)
+        return blob
+
+
+def _rows_data(rows: List[tuple], payloads: _PayloadStore) -> List[dict]:
+    """
+    Returns the data of (id, starttime, endtime, datastr, payloadid) rows.
+
+    The inline payloads are decoded with a single json.loads of a JSON array
+    joining them, which is much faster than decoding them one at a time.
+    """
+    datastrs = [row[3] for row in rows if row[4] is None]
+    inline: List[dict] = []
+    if datastrs:
+        try:
+            inline = json.loads("[" + ",".join(datastrs) + "]")
+        except ValueError:
+            inline = []
+        if len(inline) != len(datastrs):
+            # Something that isn't a single JSON value was stored, which can't
+            # be joined with the others
+            inline = [json.loads(datastr) for datastr in datastrs]
+    if len(datastrs) == len(rows):
+        return inline
+    it = iter(inline)
+    return [payloads.load(row[4]) if row[4] is not None else next(it) for row in rows]
+
+
+def _rows_to_events(cursor: sqlite3.Cursor, payloads: _PayloadStore) -> List[Event]:
+    """
+    Decodes (id, starttime, endtime, datastr, payloadid) rows, ROW_BATCH_SIZE at a time.
+
+    Times are converted a column at a time using integer microseconds (truncating
+    timestamps to milliseconds like Event does), so events can be built with
+    Event.from_normalized instead of re-parsing every timestamp.
+    """
+    events: List[Event] = []
+    durations: Dict[int, timedelta] = {}
+    from_normalized = Event.from_normalized
+    while True:
+        rows = cursor.fetchmany(ROW_BATCH_SIZE)
+        if not rows:
+            break
+        starts = [round(row[1]) for row in rows]
+        timestamps = [
+            datetime.fromtimestamp((start - start % 1000) / 1000000, timezone.utc)
+            for start in starts
+        ]
+        datas = _rows_data(rows, payloads)
+        for row, start, timestamp, data in zip(rows, starts, timestamps, datas):
+            duration_us = round(row[2]) - start
+            duration = durations.get(duration_us)
+            if duration is None:
+                duration = durations[duration_us] = timedelta(microseconds=duration_us)
+            events.append(from_normalized(row[0], timestamp, duration, data))
     return events
 
 
+def _rows_to_batch(cursor: sqlite3.Cursor, payloads: _PayloadStore) -> EventBatch:
+    """
+    Decodes (id, starttime, endtime, datastr, payloadid) rows into an EventBatch,
+    with the same timestamp truncation as _rows_to_events.
+    """
+    batch = EventBatch()
+    ids, starts, ends, datas = batch.ids, batch.starts, batch.ends, batch.data
+    while True:
+        rows = cursor.fetchmany(ROW_BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            start = round(row[1])
+            start_ms = start - start % 1000
+            ids.append(row[0])
+            starts.append(start_ms)
+            ends.append(start_ms + round(row[2]) - start)
+        datas.extend(_rows_data(rows, payloads))
+    return batch
+
+
 class SqliteStorage(AbstractStorage):
     sid = "sqlite"
 
     def __init__(
-        self, testing, filepath: Optional[str] = None, enable_lazy_commit=True
+        self,
+        testing,
+        filepath: Optional[str] = None,
+        enable_lazy_commit=True,
+        intern_payloads=False,
+        compression: Optional[str] = None,
     ) -> None:
+        """
+        If intern_payloads is set, event data is stored once per distinct payload in
+        the payloads table (optionally compressed with "zlib" or "zstd") instead of
+        inline in every event row. Both formats can be read regardless of the setting.
+        """
         self.testing = testing
         self.enable_lazy_commit = enable_lazy_commit
+        self.intern_payloads = intern_payloads
+        if compression and not intern_payloads:
+            raise ValueError("Payload compression requires intern_payloads")
 
         # Ignore the migration check if custom filepath is set
         ignore_migration_check = filepath is not None
@@ -90,12 +303,21 @@ class SqliteStorage(AbstractStorage):
         # Create tables
         self.conn.execute(CREATE_BUCKETS_TABLE)
         self.conn.execute(CREATE_EVENTS_TABLE)
+        self.conn.execute(CREATE_PAYLOADS_TABLE)
+        event_columns = [
+            row[1] for row in self.conn.execute("PRAGMA table_info(events)")
+        ]
+        if "payloadid" not in event_columns:
+            self.conn.execute(ADD_EVENTS_PAYLOADID_COLUMN)
         self.conn.execute(INDEX_BUCKETS_TABLE_ID)
         self.conn.execute(INDEX_EVENTS_TABLE_STARTTIME)
         self.conn.execute(INDEX_EVENTS_TABLE_ENDTIME)
+        self.conn.execute(INDEX_EVENTS_TABLE_PAYLOADID)
         self.conn.execute("PRAGMA journal_mode=WAL;")
         self.commit()
 
+        self.payloads = _PayloadStore(self.conn, compression)
+
         if new_db_file and not ignore_migration_check:
             logger.info("Created new SQlite db file")
             from aw_datastore import check_for_migration
@@ -204,11 +426,21 @@ class SqliteStorage(AbstractStorage):
         return self.get_metadata(bucket_id)
 
     def delete_bucket(self, bucket_id: str):
+        payload_ids = [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT DISTINCT payloadid FROM events "
+                + "WHERE bucketrow IN (SELECT rowid FROM buckets WHERE id = ?) "
+                + "AND payloadid IS NOT NULL",
+                [bucket_id],
+            )
+        ]
         self.conn.execute(
             "DELETE FROM events WHERE bucketrow IN (SELECT rowid FROM buckets WHERE id = ?)",
             [bucket_id],
         )
         cursor = self.conn.execute("DELETE FROM buckets WHERE id = ?", [bucket_id])
+        self.payloads.delete_unused(payload_ids)
         self.commit()
         if cursor.rowcount != 1:
             raise Exception("Bucket did not exist, could not delete")
@@ -233,15 +465,21 @@ class SqliteStorage(AbstractStorage):
         else:
             raise Exception("Bucket did not exist, could not get metadata")
 
-    def insert_one(self, bucket_id: str, event: Event) -> Event:
-        c = self.conn.cursor()
+    def _event_row(self, event: Event) -> Tuple[float, float, str, Optional[int]]:
+        """Returns the (starttime, endtime, datastr, payloadid) columns for an event"""
         starttime = event.timestamp.timestamp() * 1000000
         endtime = starttime + (event.duration.total_seconds() * 1000000)
         datastr = json.dumps(event.data)
+        if self.intern_payloads:
+            return starttime, endtime, "", self.payloads.intern(datastr)
+        return starttime, endtime, datastr, None
+
+    def insert_one(self, bucket_id: str, event: Event) -> Event:
+        c = self.conn.cursor()
         c.execute(
-            "INSERT INTO events(bucketrow, starttime, endtime, datastr) "
-            + "VALUES ((SELECT rowid FROM buckets WHERE id = ?), ?, ?, ?)",
-            [bucket_id, starttime, endtime, datastr],
+            "INSERT INTO events(bucketrow, starttime, endtime, datastr, payloadid) "
+            + "VALUES ((SELECT rowid FROM buckets WHERE id = ?), ?, ?, ?, ?)",
+            [bucket_id, *self._event_row(event)],
         )
         event.id = c.lastrowid
         self.conditional_commit(1)
@@ -260,52 +498,59 @@ class SqliteStorage(AbstractStorage):
 
         # Then insert events without id's set
         events_insert = [e for e in events if e.id is None]
-        event_rows = []
-        for event in events_insert:
-            starttime = event.timestamp.timestamp() * 1000000
-            endtime = starttime + (event.duration.total_seconds() * 1000000)
-            datastr = json.dumps(event.data)
-            event_rows.append((bucket_id, starttime, endtime, datastr))
+        event_rows = [(bucket_id, *self._event_row(event)) for event in events_insert]
         query = (
-            "INSERT INTO events(bucketrow, starttime, endtime, datastr) "
-            + "VALUES ((SELECT rowid FROM buckets WHERE id = ?), ?, ?, ?)"
+            "INSERT INTO events(bucketrow, starttime, endtime, datastr, payloadid) "
+            + "VALUES ((SELECT rowid FROM buckets WHERE id = ?), ?, ?, ?, ?)"
         )
         self.conn.executemany(query, event_rows)
         self.conditional_commit(len(event_rows))
 
+    def _event_payloadid(self, event_id: int) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT payloadid FROM events WHERE id = ?", [event_id]
+        ).fetchone()
+        return row[0] if row is not None else None
+
     def replace_last(self, bucket_id, event):
-        starttime = event.timestamp.timestamp() * 1000000
-        endtime = starttime + (event.duration.total_seconds() * 1000000)
-        datastr = json.dumps(event.data)
+        row = self.conn.execute(
+            """SELECT id, payloadid FROM events WHERE endtime =
+                   (SELECT max(endtime) FROM events WHERE bucketrow =
+                       (SELECT rowid FROM buckets WHERE id = ?) LIMIT 1)""",
+            [bucket_id],
+        ).fetchone()
+        if row is None:
+            return True
+        event_id, old_payload_id = row
         query = """UPDATE events
-                   SET starttime = ?, endtime = ?, datastr = ?
-                   WHERE id = (
-                        SELECT id FROM events WHERE endtime =
-                            (SELECT max(endtime) FROM events WHERE bucketrow =
-                                (SELECT rowid FROM buckets WHERE id = ?) LIMIT 1))"""
-        self.conn.execute(query, [starttime, endtime, datastr, bucket_id])
+                   SET starttime = ?, endtime = ?, datastr = ?, payloadid = ?
+                   WHERE id = ?"""
+        self.conn.execute(query, [*self._event_row(event), event_id])
+        self.payloads.delete_unused([old_payload_id])
         self.conditional_commit(1)
         return True
 
     def delete(self, bucket_id, event_id):
+        old_payload_id = self._event_payloadid(event_id)
         query = (
             "DELETE FROM events "
             + "WHERE id = ? AND bucketrow = (SELECT b.rowid FROM buckets b WHERE b.id = ?)"
         )
         cursor = self.conn.execute(query, [event_id, bucket_id])
+        self.payloads.delete_unused([old_payload_id])
         return cursor.rowcount == 1
 
     def replace(self, bucket_id, event_id, event) -> bool:
-        starttime = event.timestamp.timestamp() * 1000000
-        endtime = starttime + (event.duration.total_seconds() * 1000000)
-        datastr = json.dumps(event.data)
         query = """UPDATE events
                      SET bucketrow = (SELECT rowid FROM buckets WHERE id = ?),
                          starttime = ?,
                          endtime = ?,
-                         datastr = ?
+                         datastr = ?,
+                         payloadid = ?
                      WHERE id = ?"""
-        self.conn.execute(query, [bucket_id, starttime, endtime, datastr, event_id])
+        old_payload_id = self._event_payloadid(event_id)
+        self.conn.execute(query, [bucket_id, *self._event_row(event), event_id])
+        self.payloads.delete_unused([old_payload_id])
         self.conditional_commit(1)
         return True
 
@@ -317,13 +562,13 @@ class SqliteStorage(AbstractStorage):
         self.commit()
         c = self.conn.cursor()
         query = """
-            SELECT id, starttime, endtime, datastr
+            SELECT id, starttime, endtime, datastr, payloadid
             FROM events
             WHERE bucketrow = (SELECT rowid FROM buckets WHERE id = ?) AND id = ?
             LIMIT 1
         """
         rows = c.execute(query, [bucket_id, event_id])
-        events = _rows_to_events(rows)
+        events = _rows_to_events(rows, self.payloads)
         if events:
             return events[0]
         else:
@@ -338,22 +583,111 @@ class SqliteStorage(AbstractStorage):
     ):
         if limit == 0:
             return []
-        elif limit < 0:
+        rows = self._select_events(bucket_id, limit, starttime, endtime)
+        return _rows_to_events(rows, self.payloads)
+
+    def get_events_batch(
+        self,
+        bucket_id: str,
+        limit: int,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+    ) -> EventBatch:
+        if limit == 0:
+            return EventBatch()
+        rows = self._select_events(bucket_id, limit, starttime, endtime)
+        return _rows_to_batch(rows, self.payloads)
+
+    def get_event_periods(
+        self,
+        bucket_id: str,
+        starttime: Optional[datetime] = None,
+        endtime: Optional[datetime] = None,
+        key: Optional[str] = None,
+    ) -> Tuple[Sequence[int], Sequence[int], Optional[List[Any]]]:
+        # Only the time columns (and the value for the key) are read, instead
+        # of whole events
+        if key is not None and '"' in key:
+            return super().get_event_periods(bucket_id, starttime, endtime, key)
+        self.commit()
+        starttime_i = starttime.timestamp() * 1000000 if starttime else 0
+        endtime_i = endtime.timestamp() * 1000000 if endtime else MAX_TIMESTAMP
+        clip_starttime_i = starttime_i if starttime else -MAX_TIMESTAMP
+        columns = "max(starttime, ?), min(endtime, ?)"
+        params: List[Any] = [clip_starttime_i, endtime_i]
+        if key is not None:
+            # Payloads of interned rows are loaded (through the cache) by id instead
+            columns += (
+                ", payloadid"
+                + ", CASE WHEN payloadid IS NULL THEN json_extract(datastr, ?) END"
+                + ", CASE WHEN payloadid IS NULL THEN json_type(datastr, ?) END"
+            )
+            path = f'$."{key}"'
+            params += [path, path]
+        query = f"""
+            SELECT {columns}
+            FROM events
+            WHERE bucketrow = (SELECT rowid FROM buckets WHERE id = ?)
+            AND endtime >= ? AND starttime <= ?
+        """
+        cursor = self.conn.execute(query, params + [bucket_id, starttime_i, endtime_i])
+
+        starts = array("q")
+        ends = array("q")
+        values: Optional[List[Any]] = [] if key is not None else None
+        payload_values: Dict[int, Any] = {}
+        while True:
+            rows = cursor.fetchmany(ROW_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                # Same truncation as when reading events
+                start = round(row[0])
+                start_ms = start - start % 1000
+                starts.append(start_ms)
+                ends.append(start_ms + round(row[1]) - start)
+            if values is not None:
+                for row in rows:
+                    payload_id, value, value_type = row[2], row[3], row[4]
+                    if payload_id is not None:
+                        if payload_id not in payload_values:
+                            payload_values[payload_id] = self.payloads.load(
+                                payload_id
+                            ).get(key)
+                        value = payload_values[payload_id]
+                    elif value_type in ("array", "object"):
+                        value = json.loads(value)
+                    elif value_type in ("true", "false"):
+                        value = value_type == "true"
+                    values.append(value)
+        return starts, ends, values
+
+    def _select_events(
+        self,
+        bucket_id: str,
+        limit: int,
+        starttime: Optional[datetime],
+        endtime: Optional[datetime],
+    ) -> sqlite3.Cursor:
+        if limit < 0:
             limit = -1
         self.commit()
         c = self.conn.cursor()
         starttime_i = starttime.timestamp() * 1000000 if starttime else 0
         endtime_i = endtime.timestamp() * 1000000 if endtime else MAX_TIMESTAMP
+        # Trim events that are partially out of range (as done in aw-server-rust)
+        clip_starttime_i = starttime_i if starttime else -MAX_TIMESTAMP
         query = """
-            SELECT id, starttime, endtime, datastr
+            SELECT id, max(starttime, ?), min(endtime, ?), datastr, payloadid
             FROM events
             WHERE bucketrow = (SELECT rowid FROM buckets WHERE id = ?)
             AND endtime >= ? AND starttime <= ?
             ORDER BY endtime DESC LIMIT ?
         """
-        rows = c.execute(query, [bucket_id, starttime_i, endtime_i, limit])
-        events = _rows_to_events(rows)
-        return events
+        return c.execute(
+            query,
+            [clip_starttime_i, endtime_i, bucket_id, starttime_i, endtime_i, limit],
+        )
 
     def get_eventcount(
         self,
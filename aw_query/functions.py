@@ -1,3 +1,4 @@
+import re
 import iso8601
 from typing import Optional, Callable, Dict, Any, List
 from inspect import signature
@@ -11,22 +12,28 @@ from aw_transform import (
     filter_period_intersect,
     filter_keyvals,
     filter_keyvals_regex,
+    filter_keyvals_include_exclude,
     period_union,
     union_no_overlap,
     categorize,
     tag,
     Rule,
     merge_events_by_keys,
+    group_by_keys,
     chunk_events_by_key,
     sort_by_timestamp,
     sort_by_duration,
+    top_by_duration,
     sum_durations,
     concat,
     split_url_events,
     simplify_string,
     flood,
+    heartbeat_reduce,
     limit_events,
+    histogram,
 )
+from aw_transform.histogram import histogram_columns
 
 from .exceptions import QueryFunctionException
 
@@ -176,6 +183,32 @@ def q2_query_bucket_eventcount(
     return datastore[bucketname].get_eventcount(starttime=starttime, endtime=endtime)
 
 
+@q2_function(histogram)
+@q2_typecheck
+def q2_query_bucket_histogram(
+    datastore: Datastore,
+    namespace: TNamespace,
+    bucketname: str,
+    bin_size: str,
+    tz: Optional[str] = None,
+    key: Optional[str] = None,
+) -> List[Event]:
+    """
+    Same as ``histogram(query_bucket(bucketname), bin_size, tz, key)``, but
+    only reads the times (and the value for the key) of the events.
+    """
+    _verify_bucket_exists(datastore, bucketname)
+    starttime = iso8601.parse_date(namespace["STARTTIME"])
+    endtime = iso8601.parse_date(namespace["ENDTIME"])
+    starts, ends, values = datastore[bucketname].get_periods(starttime, endtime, key)
+    try:
+        return histogram_columns(
+            starts, ends, values, bin_size, tz, key, starttime, endtime
+        )
+    except ValueError as e:
+        raise QueryFunctionException(str(e))
+
+
 """
     Filtering functions
 """
@@ -193,6 +226,14 @@ def q2_exclude_keyvals(events: list, key: str, vals: list) -> List[Event]:
     return filter_keyvals(events, key, vals, True)
 
 
+@q2_function(filter_keyvals_include_exclude)
+@q2_typecheck
+def q2_filter_keyvals_include_exclude(
+    events: list, key: str, include: list, exclude: list
+) -> List[Event]:
+    return filter_keyvals_include_exclude(events, key, include, exclude)
+
+
 @q2_function(filter_keyvals_regex)
 @q2_typecheck
 def q2_filter_keyvals_regex(events: list, key: str, regex: str) -> List[Event]:
@@ -228,10 +269,34 @@ def q2_merge_events_by_keys(events: list, keys: list) -> List[Event]:
     return merge_events_by_keys(events, keys)
 
 
+@q2_function(group_by_keys)
+@q2_typecheck
+def q2_group_by_keys(
+    events: list, keys: list, aggregations: Optional[list] = None
+) -> List[Event]:
+    try:
+        return group_by_keys(events, keys, aggregations or [])
+    except ValueError as e:
+        raise QueryFunctionException(str(e))
+
+
+@q2_function(histogram)
+@q2_typecheck
+def q2_histogram(
+    events: list, bin_size: str, tz: Optional[str] = None, key: Optional[str] = None
+) -> List[Event]:
+    try:
+        return histogram(events, bin_size, tz, key)
+    except ValueError as e:
+        raise QueryFunctionException(str(e))
+
+
 @q2_function(chunk_events_by_key)
 @q2_typecheck
-def q2_chunk_events_by_key(events: list, key: str) -> List[Event]:
-    return chunk_events_by_key(events, key)
+def q2_chunk_events_by_key(
+    events: list, key: str, pulsetime: float = 5.0, summarize: bool = False
+) -> List[Event]:
+    return chunk_events_by_key(events, key, pulsetime, summarize)
 
 
 """
@@ -251,6 +316,12 @@ def q2_sort_by_duration(events: list) -> List[Event]:
     return sort_by_duration(events)
 
 
+@q2_function(top_by_duration)
+@q2_typecheck
+def q2_top_by_duration(events: list, count: int) -> List[Event]:
+    return top_by_duration(events, count)
+
+
 """
     Summarizing functions
 """
@@ -270,8 +341,10 @@ def q2_concat(events1: list, events2: list) -> List[Event]:
 
 @q2_function(union_no_overlap)
 @q2_typecheck
-def q2_union_no_overlap(events1: list, events2: list) -> List[Event]:
-    return union_no_overlap(events1, events2)
+def q2_union_no_overlap(events1: list, events2: list, *more_events) -> List[Event]:
+    for events in more_events:
+        _verify_variable_is_type(events, list)
+    return union_no_overlap(events1, events2, *more_events)
 
 
 """
@@ -285,6 +358,12 @@ def q2_flood(events: list) -> List[Event]:
     return flood(events)
 
 
+@q2_function(heartbeat_reduce)
+@q2_typecheck
+def q2_heartbeat_reduce(events: list, pulsetime: float = 5.0) -> List[Event]:
+    return heartbeat_reduce(events, pulsetime)
+
+
 """
     Watcher specific functions
 """
@@ -292,14 +371,31 @@ def q2_flood(events: list) -> List[Event]:
 
 @q2_function(split_url_events)
 @q2_typecheck
-def q2_split_url_events(events: list) -> List[Event]:
-    return split_url_events(events)
+def q2_split_url_events(events: list, fields: Optional[list] = None) -> List[Event]:
+    try:
+        return split_url_events(events, fields)
+    except ValueError as e:
+        raise QueryFunctionException(str(e))
 
 
 @q2_function(simplify_string)
 @q2_typecheck
-def q2_simplify_window_titles(events: list, key: str) -> List[Event]:
-    return simplify_string(events, key=key)
+def q2_simplify_window_titles(
+    events: list, key: str, rules: Optional[list] = None
+) -> List[Event]:
+    for rule in rules or []:
+        if not (
+            isinstance(rule, list)
+            and len(rule) == 2
+            and all(isinstance(s, str) for s in rule)
+        ):
+            raise QueryFunctionException(
+                f"Invalid simplify rule {rule}, expected a [regex, replacement] pair of strings"
+            )
+    try:
+        return simplify_string(events, key=key, rules=rules)
+    except (ValueError, re.error) as e:
+        raise QueryFunctionException(f"Invalid simplify rules: {e}")
 
 
 """
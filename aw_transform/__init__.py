@@ -1,42 +1,83 @@
-from .filter_keyvals import filter_keyvals, filter_keyvals_regex
-from .filter_period_intersect import filter_period_intersect, period_union, union
-from .heartbeats import heartbeat_merge, heartbeat_reduce
+"""
+Transforms for lists of events.
+
+None of the transforms modify the events (or their data) that they are given.
+Events that need to change are shallow-copied with ``copy.copy``, and their
+``data`` dict is only copied when it is changed, so unchanged events and
+payloads are shared between the input and the result. Code using the results
+should therefore also copy before modifying events in place.
+"""
+
+from .filter_keyvals import (
+    filter_keyvals,
+    filter_keyvals_include_exclude,
+    filter_keyvals_regex,
+    iter_filter_keyvals,
+    iter_filter_keyvals_include_exclude,
+    iter_filter_keyvals_regex,
+)
+from .filter_period_intersect import (
+    filter_period_intersect,
+    iter_filter_period_intersect,
+    period_union,
+    union,
+)
+from .heartbeats import heartbeat_merge, heartbeat_reduce, iter_heartbeat_reduce
 from .merge_events_by_keys import merge_events_by_keys
-from .chunk_events_by_key import chunk_events_by_key
+from .group_by_keys import group_by_keys
+from .chunk_events_by_key import chunk_events_by_key, iter_chunk_events_by_key
 from .sort_by import (
     sort_by_timestamp,
     sort_by_duration,
+    top_by_duration,
     sum_durations,
     concat,
     limit_events,
 )
-from .split_url_events import split_url_events
-from .simplify import simplify_string
+from .split_url_events import split_url_events, iter_split_url_events
+from .simplify import simplify_string, iter_simplify_string
 from .flood import flood
-from .classify import categorize, tag, Rule
+from .classify import categorize, tag, iter_categorize, iter_tag, Rule
 from .union_no_overlap import union_no_overlap
+from .parallel import parallel_map
+from .histogram import histogram
 
 __all__ = [
     "flood",
     "concat",
     "categorize",
     "tag",
+    "iter_categorize",
+    "iter_tag",
     "Rule",
     "period_union",
     "filter_period_intersect",
+    "iter_filter_period_intersect",
     "union",
     "union_no_overlap",
     "concat",
     "sum_durations",
     "sort_by_timestamp",
     "sort_by_duration",
+    "top_by_duration",
     "heartbeat_reduce",
+    "iter_heartbeat_reduce",
     "heartbeat_merge",
     "merge_events_by_keys",
+    "group_by_keys",
     "chunk_events_by_key",
+    "iter_chunk_events_by_key",
     "limit_events",
     "filter_keyvals",
     "filter_keyvals_regex",
+    "filter_keyvals_include_exclude",
+    "iter_filter_keyvals",
+    "iter_filter_keyvals_regex",
+    "iter_filter_keyvals_include_exclude",
     "split_url_events",
+    "iter_split_url_events",
     "simplify_string",
+    "iter_simplify_string",
+    "parallel_map",
+    "histogram",
 ]
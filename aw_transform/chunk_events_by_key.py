@@ -1,39 +1,69 @@
 import logging
 from datetime import timedelta
-from typing import List
+from typing import Iterable, Iterator, List, Optional
 
-from aw_core.models import Event
+from aw_core.models import Event, timestamp_to_us
+
+_TD_1US = timedelta(microseconds=1)
 
 logger = logging.getLogger(__name__)
 
 
-def chunk_events_by_key(
-    events: List[Event], key: str, pulsetime: float = 5.0
-) -> List[Event]:
+def iter_chunk_events_by_key(
+    events: Iterable[Event],
+    key: str,
+    pulsetime: float = 5.0,
+    summarize: bool = False,
+) -> Iterator[Event]:
     """
-    "Chunks" adjacent events together which have the same value for a key, and stores the
-    original events in the :code:`subevents` key of the new event.
+    Generator version of :func:`chunk_events_by_key`, which yields each chunk
+    as soon as the first event after it has been seen.
     """
-    chunked_events: List[Event] = []
+    # Times in microseconds
+    max_gap = timedelta(seconds=pulsetime) // _TD_1US
+    chunk: Optional[Event] = None
+    chunk_end = 0
     for event in events:
         if key not in event.data:
-            break
-        timediff = timedelta(seconds=999999999)  # FIXME: ugly but works
-        if len(chunked_events) > 0:
-            timediff = event.timestamp - (events[-1].timestamp + events[-1].duration)
+            continue
+        value = event.data[key]
+        start = timestamp_to_us(event.timestamp)
+        end = start + event.duration // _TD_1US
         if (
-            len(chunked_events) > 0
-            and chunked_events[-1].data[key] == event.data[key]
-            and timediff < timedelta(seconds=pulsetime)
+            chunk is not None
+            and chunk.data[key] == value
+            and start - chunk_end < max_gap
         ):
-            chunked_event = chunked_events[-1]
-            chunked_event.duration += event.duration
-            chunked_event.data["subevents"].append(event)
+            chunk.duration += event.duration
+            if summarize:
+                chunk.data["$count"] += 1
+            else:
+                chunk.data["subevents"].append(event)
+            chunk_end = max(chunk_end, end)
         else:
-            data = {key: event.data[key], "subevents": [event]}
-            chunked_event = Event(
-                timestamp=event.timestamp, duration=event.duration, data=data
-            )
-            chunked_events.append(chunked_event)
+            if chunk is not None:
+                yield chunk
+            if summarize:
+                data = {key: value, "$count": 1}
+            else:
+                data = {key: value, "subevents": [event]}
+            chunk = Event(timestamp=event.timestamp, duration=event.duration, data=data)
+            chunk_end = end
+    if chunk is not None:
+        yield chunk
+
+
+def chunk_events_by_key(
+    events: List[Event], key: str, pulsetime: float = 5.0, summarize: bool = False
+) -> List[Event]:
+    """
+    "Chunks" adjacent events together which have the same value for a key, and stores the
+    original events in the :code:`subevents` key of the new event.
+
+    Events are adjacent if the gap between the end of the chunk and the start of
+    the next event is less than ``pulsetime`` seconds. Events without the key are skipped.
 
-    return chunked_events
+    If ``summarize`` is set, only the number of events in each chunk is stored
+    (in :code:`$count`) instead of the events themselves.
+    """
+    return list(iter_chunk_events_by_key(events, key, pulsetime, summarize))
@@ -1,10 +1,21 @@
-from typing import Pattern, List, Iterable, Tuple, Dict, Optional, Any
-from functools import reduce
+from copy import copy
+from typing import (
+    Pattern,
+    List,
+    Iterable,
+    Iterator,
+    Sequence,
+    Tuple,
+    Dict,
+    Optional,
+    Any,
+)
+from functools import lru_cache, reduce
+from threading import Lock
 import re
 
 from aw_core import Event
 
-
 Tag = str
 Category = List[str]
 
@@ -40,25 +51,155 @@ class Rule:
         return False
 
 
+# Max number of distinct values (and combinations of values) each classifier remembers the matches for
+CLASSIFY_CACHE_SIZE = 8192
+# Max number of rule sets to keep classifiers around for, see get_classifier
+CLASSIFIER_CACHE_SIZE = 8
+
+RuleFingerprint = Tuple[Optional[Tuple[str, int, Optional[Tuple[str, ...]]]], ...]
+
+
+class _RuleGroup:
+    """Rules sharing the same select_keys, so values are only selected once for all of them"""
+
+    def __init__(self, select_keys: Optional[Tuple[str, ...]], cache_size: int) -> None:
+        self.select_keys = select_keys
+        self.rules: List[Tuple[int, Pattern]] = []
+        self.match_value = lru_cache(maxsize=cache_size)(self._match_value)
+
+    def values(self, data: dict) -> Tuple[str, ...]:
+        """Returns the string values the rules are matched against"""
+        if self.select_keys:
+            values: Iterable = [data.get(key, None) for key in self.select_keys]
+        else:
+            values = data.values()
+        return tuple(val for val in values if isinstance(val, str))
+
+    def _match_value(self, val: str) -> Tuple[int, ...]:
+        return tuple(idx for idx, regex in self.rules if regex.search(val))
+
+
+class Classifier:
+    """
+    Matches event data against a list of rules at once.
+
+    Rules are grouped by their select_keys, and since most events share their
+    data with many others, matches are remembered (in LRU caches) both for each
+    distinct combination of selected values and for each single string value.
+    """
+
+    def __init__(
+        self, rules: Sequence[Rule], cache_size: int = CLASSIFY_CACHE_SIZE
+    ) -> None:
+        groups: Dict[Optional[Tuple[str, ...]], _RuleGroup] = {}
+        for idx, rule in enumerate(rules):
+            # A rule without a regex never matches
+            if rule.regex:
+                keys = tuple(rule.select_keys) if rule.select_keys else None
+                if keys not in groups:
+                    groups[keys] = _RuleGroup(keys, cache_size)
+                groups[keys].rules.append((idx, rule.regex))
+        self.groups = list(groups.values())
+        self._match = lru_cache(maxsize=cache_size)(self._match_values)
+
+    def matching(self, data: dict) -> Tuple[int, ...]:
+        """Returns the indices of the rules matching the data, in rule order"""
+        return self._match(tuple(group.values(data) for group in self.groups))
+
+    def _match_values(self, values: Tuple[Tuple[str, ...], ...]) -> Tuple[int, ...]:
+        matched: set = set()
+        for group, group_values in zip(self.groups, values):
+            for val in group_values:
+                matched.update(group.match_value(val))
+        return tuple(sorted(matched))
+
+
+def _fingerprint(rules: Sequence[Rule]) -> RuleFingerprint:
+    return tuple(
+        (
+            (
+                rule.regex.pattern,
+                rule.regex.flags,
+                tuple(rule.select_keys) if rule.select_keys else None,
+            )
+            if rule.regex
+            else None
+        )
+        for rule in rules
+    )
+
+
+_classifiers: Dict[RuleFingerprint, Classifier] = {}
+_classifiers_lock = Lock()
+
+
+def get_classifier(rules: Sequence[Rule]) -> Classifier:
+    """
+    Returns a classifier for the rules, reusing the one (and its caches) from
+    earlier calls with an identical rule set, such as repeated queries.
+    """
+    fingerprint = _fingerprint(rules)
+    with _classifiers_lock:
+        classifier = _classifiers.pop(fingerprint, None)
+        if classifier is None:
+            classifier = Classifier(rules)
+        # Reinsert to keep the dict ordered from least to most recently used
+        _classifiers[fingerprint] = classifier
+        while len(_classifiers) > CLASSIFIER_CACHE_SIZE:
+            del _classifiers[next(iter(_classifiers))]
+    return classifier
+
+
+def iter_categorize(
+    events: Iterable[Event], classes: List[Tuple[Category, Rule]]
+) -> Iterator[Event]:
+    """Generator version of :func:`categorize`"""
+    classifier = get_classifier([rule for _, rule in classes])
+    # The category picked for each combination of matching rules
+    categories: Dict[Tuple[int, ...], Category] = {}
+    return (_categorize_one(e, classes, classifier, categories) for e in events)
+
+
 def categorize(
     events: List[Event], classes: List[Tuple[Category, Rule]]
 ) -> List[Event]:
-    return [_categorize_one(e, classes) for e in events]
+    return list(iter_categorize(events, classes))
+
+
+def _categorize_one(
+    e: Event,
+    classes: List[Tuple[Category, Rule]],
+    classifier: Classifier,
+    categories: Dict[Tuple[int, ...], Category],
+) -> Event:
+    matches = classifier.matching(e.data)
+    category = categories.get(matches)
+    if category is None:
+        category = _pick_category(classes[i][0] for i in matches)
+        categories[matches] = category
+    e = copy(e)
+    e.data = {**e.data, "$category": category}
+    return e
 
 
-def _categorize_one(e: Event, classes: List[Tuple[Category, Rule]]) -> Event:
-    e.data["$category"] = _pick_category(
-        [_cls for _cls, rule in classes if rule.match(e)]
-    )
-    return e
+def iter_tag(
+    events: Iterable[Event], classes: List[Tuple[Tag, Rule]]
+) -> Iterator[Event]:
+    """Generator version of :func:`tag`"""
+    classifier = get_classifier([rule for _, rule in classes])
+    return (_tag_one(e, classes, classifier) for e in events)
 
 
 def tag(events: List[Event], classes: List[Tuple[Tag, Rule]]) -> List[Event]:
-    return [_tag_one(e, classes) for e in events]
+    return list(iter_tag(events, classes))
 
 
-def _tag_one(e: Event, classes: List[Tuple[Tag, Rule]]) -> Event:
-    e.data["$tags"] = [_cls for _cls, rule in classes if rule.match(e)]
+def _tag_one(
+    e: Event, classes: List[Tuple[Tag, Rule]], classifier: Classifier
+) -> Event:
+    tags = [classes[i][0] for i in classifier.matching(e.data)]
+    e = copy(e)
+    e.data = {**e.data, "$tags": tags}
     return e
 
 
@@ -1,28 +1,108 @@
 import logging
-from typing import List
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, Optional, Pattern, Set
 import re
 
 from aw_core.models import Event
 
 logger = logging.getLogger(__name__)
 
+# Max number of compiled regexes to keep
+REGEX_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def _compile(regex: str) -> Pattern:
+    return re.compile(regex)
+
+
+class _Values:
+    """
+    Values to test membership in, using a set for the hashable ones such that
+    a lookup doesn't depend on the number of values.
+    """
+
+    def __init__(self, vals: Iterable[Any]) -> None:
+        self.vals = list(vals)
+        self.hashable: Set[Any] = set()
+        self.unhashable: List[Any] = []
+        for val in self.vals:
+            try:
+                self.hashable.add(val)
+            except TypeError:
+                self.unhashable.append(val)
+
+    def __contains__(self, value: Any) -> bool:
+        try:
+            if value in self.hashable:
+                return True
+        except TypeError:
+            # Unhashable values (such as lists) are compared against all values
+            return value in self.vals
+        return bool(self.unhashable) and value in self.unhashable
+
+
+def iter_filter_keyvals(
+    events: Iterable[Event], key: str, vals: List[str], exclude=False
+) -> Iterator[Event]:
+    """Generator version of :func:`filter_keyvals`"""
+    return iter_filter_keyvals_include_exclude(
+        events,
+        key,
+        include=None if exclude else vals,
+        exclude=vals if exclude else None,
+    )
+
 
 def filter_keyvals(
     events: List[Event], key: str, vals: List[str], exclude=False
 ) -> List[Event]:
-    def predicate(event):
-        return key in event.data and event.data[key] in vals
+    return list(iter_filter_keyvals(events, key, vals, exclude))
 
-    if exclude:
-        return [e for e in events if not predicate(e)]
-    else:
-        return [e for e in events if predicate(e)]
 
+def iter_filter_keyvals_include_exclude(
+    events: Iterable[Event],
+    key: str,
+    include: Optional[List[Any]] = None,
+    exclude: Optional[List[Any]] = None,
+) -> Iterator[Event]:
+    """Generator version of :func:`filter_keyvals_include_exclude`"""
+    included = _Values(include) if include is not None else None
+    excluded = _Values(exclude) if exclude is not None else None
+    for e in events:
+        data = e.data
+        if key in data:
+            value = data[key]
+            if (included is None or value in included) and (
+                excluded is None or value not in excluded
+            ):
+                yield e
+        elif included is None:
+            yield e
 
-def filter_keyvals_regex(events: List[Event], key: str, regex: str) -> List[Event]:
-    r = re.compile(regex)
 
-    def predicate(event):
-        return key in event.data and bool(r.findall(event.data[key]))
+def filter_keyvals_include_exclude(
+    events: List[Event],
+    key: str,
+    include: Optional[List[Any]] = None,
+    exclude: Optional[List[Any]] = None,
+) -> List[Event]:
+    """
+    Keeps the events which have one of the ``include`` values for the key (if
+    given) and don't have one of the ``exclude`` values, in a single pass.
+
+    Same as filtering with :func:`filter_keyvals` and then excluding with it.
+    """
+    return list(iter_filter_keyvals_include_exclude(events, key, include, exclude))
 
-    return [e for e in events if predicate(e)]
+
+def iter_filter_keyvals_regex(
+    events: Iterable[Event], key: str, regex: str
+) -> Iterator[Event]:
+    """Generator version of :func:`filter_keyvals_regex`"""
+    search = _compile(regex).search
+    return (e for e in events if key in e.data and search(e.data[key]) is not None)
+
+
+def filter_keyvals_regex(events: List[Event], key: str, regex: str) -> List[Event]:
+    return list(iter_filter_keyvals_regex(events, key, regex))
@@ -1,23 +1,58 @@
 import logging
-from typing import List, Iterable, Tuple
-from copy import deepcopy
-
-from aw_core import Event
+from copy import copy
+from datetime import timedelta
+from typing import Iterator, List, Iterable, Tuple
+
+from aw_core.models import (
+    CompactEvent,
+    Event,
+    EventBatch,
+    timestamp_to_us,
+    us_to_timestamp,
+)
 from timeslot import Timeslot
 
+from .intervals import check_sorted, intersecting_pairs, iter_intersecting, union_groups
+
 logger = logging.getLogger(__name__)
 
+_TD_1US = timedelta(microseconds=1)
 
-def _get_event_period(event: Event) -> Timeslot:
-    start = event.timestamp
-    end = start + event.duration
-    return Timeslot(start, end)
 
+def _sorted_periods(events: List[Event]) -> Tuple[List[Event], List[int], List[int]]:
+    """Returns the events sorted by timestamp, along with their start and end in microseconds"""
+    batch = EventBatch.from_events(events)
+    order = sorted(range(len(events)), key=batch.starts.__getitem__)
+    return (
+        [events[i] for i in order],
+        [batch.starts[i] for i in order],
+        [batch.ends[i] for i in order],
+    )
 
-def _replace_event_period(event: Event, period: Timeslot) -> Event:
-    e = deepcopy(event)
-    e.timestamp = period.start
-    e.duration = period.duration
+
+def _iter_periods(events: Iterable[Event]) -> Iterator[Tuple[int, int, Event]]:
+    """Yields the start and end in microseconds of each event, along with the event"""
+    for e in events:
+        if isinstance(e, CompactEvent):
+            start = e.start_us
+            yield start, start + e.duration_us, e
+        else:
+            start = timestamp_to_us(e.timestamp)
+            yield start, start + e.duration // _TD_1US, e
+
+
+def _replace_event_period(event: Event, start: int, end: int) -> Event:
+    e = copy(event)
+    if isinstance(e, CompactEvent):
+        # Truncated to milliseconds like the timestamp setter does
+        e.start_us, e.duration_us = start - start % 1000, end - start
+    elif type(e) is Event and not start % 1000:
+        # Already normalized, so skip the parsing in the setters
+        e["timestamp"] = us_to_timestamp(start)
+        e["duration"] = timedelta(microseconds=end - start)
+    else:
+        e.timestamp = us_to_timestamp(start)
+        e.duration = timedelta(microseconds=end - start)
     return e
 
 
@@ -25,36 +60,11 @@ def _intersecting_eventpairs(
     events1: List[Event], events2: List[Event]
 ) -> Iterable[Tuple[Event, Event, Timeslot]]:
     """A generator that yields each overlapping pair of events from two eventlists along with a Timeslot of the intersection"""
-    events1.sort(key=lambda e: e.timestamp)
-    events2.sort(key=lambda e: e.timestamp)
-    e1_i = 0
-    e2_i = 0
-    while e1_i < len(events1) and e2_i < len(events2):
-        e1 = events1[e1_i]
-        e2 = events2[e2_i]
-        e1_p = _get_event_period(e1)
-        e2_p = _get_event_period(e2)
-
-        ip = e1_p.intersection(e2_p)
-        if ip:
-            # If events intersected, yield events
-            yield (e1, e2, ip)
-            if e1_p.end <= e2_p.end:
-                e1_i += 1
-            else:
-                e2_i += 1
-        else:
-            # No intersection, check if event is before/after filterevent
-            if e1_p.end <= e2_p.start:
-                # Event ended before filter event started
-                e1_i += 1
-            elif e2_p.end <= e1_p.start:
-                # Event started after filter event ended
-                e2_i += 1
-            else:
-                logger.error("Should be unreachable, skipping period")
-                e1_i += 1
-                e2_i += 1
+    events1, starts1, ends1 = _sorted_periods(events1)
+    events2, starts2, ends2 = _sorted_periods(events2)
+    for i, j, start, end in intersecting_pairs(starts1, ends1, starts2, ends2):
+        ip = Timeslot(us_to_timestamp(start), us_to_timestamp(end))
+        yield (events1[i], events2[j], ip)
 
 
 def filter_period_intersect(
@@ -80,13 +90,44 @@ def filter_period_intersect(
     A JavaScript version used to exist in aw-webui but was removed in `this PR <https://github.com/ActivityWatch/aw-webui/pull/48>`_.
     """
 
-    events = sorted(events)
-    filterevents = sorted(filterevents)
+    events, starts, ends = _sorted_periods(list(events))
+    _, filter_starts, filter_ends = _sorted_periods(list(filterevents))
+
+    result = []
+    for i, _, start, end in intersecting_pairs(
+        starts, ends, filter_starts, filter_ends
+    ):
+        if start == starts[i] and end == ends[i]:
+            # Entirely within the filter period, so can be shared as-is
+            result.append(events[i])
+        else:
+            result.append(_replace_event_period(events[i], start, end))
+    return result
+
 
-    return [
-        _replace_event_period(e1, ip)
-        for (e1, _, ip) in _intersecting_eventpairs(events, filterevents)
-    ]
+def iter_filter_period_intersect(
+    events: Iterable[Event], filterevents: Iterable[Event]
+) -> Iterator[Event]:
+    """
+    Generator version of :func:`filter_period_intersect`, for events and
+    filterevents which are both sorted by timestamp, such that only one event
+    of each is held at a time.
+
+    Unless Python runs with optimizations (``-O``), a ValueError is raised if
+    either isn't sorted.
+    """
+    periods = _iter_periods(events)
+    filter_periods = _iter_periods(filterevents)
+    if __debug__:
+        periods = check_sorted(periods)
+        filter_periods = check_sorted(filter_periods)
+    for (event, event_start, event_end), _, start, end in iter_intersecting(
+        ((s, e, (event, s, e)) for s, e, event in periods), filter_periods
+    ):
+        if start == event_start and end == event_end:
+            yield event
+        else:
+            yield _replace_event_period(event, start, end)
 
 
 def period_union(events1: List[Event], events2: List[Event]) -> List[Event]:
@@ -103,24 +144,17 @@ def period_union(events1: List[Event], events2: List[Event]) -> List[Event]:
         events2   | ------  ---  --    ----   |
         result    | -----------  -- --------- |
     """
-    events = sorted(events1 + events2)
+    events, starts, ends = _sorted_periods(list(events1) + list(events2))
     merged_events = []
-    if events:
-        merged_events.append(events.pop(0))
-    for e in events:
-        last_event = merged_events[-1]
-
-        e_p = _get_event_period(e)
-        le_p = _get_event_period(last_event)
-
-        if not e_p.gap(le_p):
-            new_period = e_p.union(le_p)
-            merged_events[-1] = _replace_event_period(last_event, new_period)
+    for i, start, end in union_groups(starts, ends):
+        e = events[i]
+        if start != starts[i] or end != ends[i]:
+            e = _replace_event_period(e, start, end)
         else:
-            merged_events.append(e)
-    for event in merged_events:
+            e = copy(e)
         # Clear data
-        event.data = {}
+        e.data = {}
+        merged_events.append(e)
     return merged_events
 
 
@@ -1,12 +1,20 @@
 import logging
+from copy import copy
 from datetime import timedelta
-from copy import deepcopy
 from typing import List
 
-from aw_core.models import Event
+from aw_core.models import CompactEvent, Event, EventBatch, us_to_timestamp
 
 logger = logging.getLogger(__name__)
 
+# If negative gaps are smaller than this (in microseconds), prune them to become zero
+NEGATIVE_GAP_TRIM_THRES = 100000
+
+
+def _trunc_ms(us: int) -> int:
+    # Event truncates timestamps to milliseconds when they are set
+    return us - us % 1000
+
 
 def flood(events: List[Event], pulsetime: float = 5) -> List[Event]:
     """
@@ -19,72 +27,99 @@ def flood(events: List[Event], pulsetime: float = 5) -> List[Event]:
     # NOTE: This algorithm has a lot of smaller details that need to be
     #       carefully considered by anyone wishing to edit it, see:
     #        - https://github.com/ActivityWatch/aw-core/pull/73
+    #
+    # Works on integer microseconds and interned data ids instead of the events
+    # themselves, the events are only copied at the end if they were changed.
 
-    events = deepcopy(events)
-    events = sorted(events, key=lambda e: e.timestamp)
+    events = list(events)
+    batch = EventBatch.from_events(events)
+    order = sorted(range(len(events)), key=batch.starts.__getitem__)
+    starts = [batch.starts[i] for i in order]
+    durations = [batch.ends[i] - batch.starts[i] for i in order]
+    datas = [batch.data[i] for i in order]
 
-    # If negative gaps are smaller than this, prune them to become zero
-    negative_gap_trim_thres = timedelta(seconds=0.1)
+    pulse = timedelta(seconds=pulsetime) // timedelta(microseconds=1)
+    thres = NEGATIVE_GAP_TRIM_THRES
 
     warned_about_negative_gap_safe = False
     warned_about_negative_gap_unsafe = False
 
-    for e1, e2 in zip(events[:-1], events[1:]):
-        gap = e2.timestamp - (e1.timestamp + e1.duration)
+    for i in range(len(starts) - 1):
+        s1, d1, s2, d2 = starts[i], durations[i], starts[i + 1], durations[i + 1]
+        gap = s2 - (s1 + d1)
 
         if not gap:
             continue
 
+        # Only compared when needed, which is cheaper than interning all payloads
+        data1, data2 = datas[i], datas[i + 1]
+        same_data = data1 is data2 or data1 == data2
+
         # Sanity check in case events overlap
-        if gap < timedelta(0) and e1.data == e2.data:
+        if gap < 0 and same_data:
             # Events with negative gap but same data can safely be merged
-            start = min(e1.timestamp, e2.timestamp)
-            end = max(e1.timestamp + e1.duration, e2.timestamp + e2.duration)
-            e1.timestamp, e1.duration = start, (end - start)
-            e2.timestamp, e2.duration = end, timedelta(0)
+            start = min(s1, s2)
+            end = max(s1 + d1, s2 + d2)
+            starts[i], durations[i] = _trunc_ms(start), end - start
+            starts[i + 1], durations[i + 1] = _trunc_ms(end), 0
             if not warned_about_negative_gap_safe:
                 logger.warning(
                     "Gap was of negative duration but could be safely merged ({}s). This message will only show once per batch.".format(
-                        gap.total_seconds()
+                        gap / 1000000
                     )
                 )
                 warned_about_negative_gap_safe = True
-        elif gap < -negative_gap_trim_thres and not warned_about_negative_gap_unsafe:
+        elif gap < -thres and not warned_about_negative_gap_unsafe:
             # Events with negative gap but differing data cannot be merged safely
             logger.warning(
                 "Gap was of negative duration and could NOT be safely merged ({}s). This warning will only show once per batch.".format(
-                    gap.total_seconds()
+                    gap / 1000000
                 )
             )
             warned_about_negative_gap_unsafe = True
-            # logger.warning("Event 1 (id {}): {} {}".format(e1.id, e1.timestamp, e1.duration))
-            # logger.warning("Event 2 (id {}): {} {}".format(e2.id, e2.timestamp, e2.duration))
-        elif -negative_gap_trim_thres < gap <= timedelta(seconds=pulsetime):
-            e2_end = e2.timestamp + e2.duration
+        elif -thres < gap <= pulse:
+            e2_end = s2 + d2
 
             # Prioritize flooding from the longer event
-            if e1.duration >= e2.duration:
-                if e1.data == e2.data:
+            if d1 >= d2:
+                if same_data:
                     # Extend e1 to the end of e2
                     # Set duration of e2 to zero (mark to delete)
-                    e1.duration = e2_end - e1.timestamp
-                    e2.timestamp = e2_end
-                    e2.duration = timedelta(0)
+                    durations[i] = e2_end - s1
+                    starts[i + 1] = _trunc_ms(e2_end)
+                    durations[i + 1] = 0
                 else:
                     # Extend e1 to the start of e2
-                    e1.duration = e2.timestamp - e1.timestamp
+                    durations[i] = s2 - s1
             else:
-                if e1.data == e2.data:
+                if same_data:
                     # Extend e2 to the start of e1, discard e1
-                    e2.timestamp = e1.timestamp
-                    e2.duration = e2_end - e2.timestamp
-                    e1.duration = timedelta(0)
+                    starts[i + 1] = _trunc_ms(s1)
+                    durations[i + 1] = e2_end - starts[i + 1]
+                    durations[i] = 0
                 else:
                     # Extend e2 backwards to end of e1
-                    e2.timestamp = e1.timestamp + e1.duration
-                    e2.duration = e2_end - e2.timestamp
+                    starts[i + 1] = _trunc_ms(s1 + d1)
+                    durations[i + 1] = e2_end - starts[i + 1]
 
-    # Filter out remaining zero-duration events
-    events = [e for e in events if e.duration > timedelta(0)]
+    # Filter out remaining zero-duration events, copying the ones that changed
+    flooded = []
+    orig_starts, orig_ends = batch.starts, batch.ends
+    for start, duration, i in zip(starts, durations, order):
+        if duration <= 0:
+            continue
+        e = events[i]
+        if start != orig_starts[i] or start + duration != orig_ends[i]:
+            e = copy(e)
+            if isinstance(e, CompactEvent):
+                e.start_us, e.duration_us = start, duration
+            elif type(e) is Event and not start % 1000:
+                # Already normalized, so skip the parsing in the setters
+                e["timestamp"] = us_to_timestamp(start)
+                e["duration"] = timedelta(microseconds=duration)
+            else:
+                e.timestamp = us_to_timestamp(start)
+                e.duration = timedelta(microseconds=duration)
+        flooded.append(e)
 
-    return events
+    return flooded
@@ -0,0 +1,130 @@
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+from aw_core.models import Event, EventBatch, us_to_timestamp
+
+# Aggregations which can be computed for each group, stored in the data of the
+# resulting events with a "$" prefix (e.g. "$count"). The summed duration is
+# always computed and stored as the duration of the event.
+AGGREGATIONS = (
+    "count",
+    "min_duration",
+    "max_duration",
+    "first_timestamp",
+    "last_timestamp",
+)
+
+
+def _composite_key(data: dict, keys: Sequence[str]) -> Tuple:
+    composite_key: Tuple = ()
+    for key in keys:
+        if key in data:
+            val = data[key]
+            # Needed for when the value is a list, such as for categories
+            if isinstance(val, list):
+                val = tuple(val)
+            composite_key = composite_key + (val,)
+    return composite_key
+
+
+def _group_codes(datas: List[dict], keys: Sequence[str]) -> Tuple[List[int], List[int]]:
+    """
+    Returns the group of each payload, along with the index of the first
+    payload in each group.
+    """
+    codes: List[int] = []
+    firsts: List[int] = []
+    groups: Dict[Hashable, int] = {}
+    # Payloads are often shared between events, so look them up by identity
+    # before building their key (keeping the payload to keep its id valid)
+    by_identity: Dict[int, Tuple[dict, int]] = {}
+    for i, data in enumerate(datas):
+        hit = by_identity.get(id(data))
+        if hit is not None and hit[0] is data:
+            codes.append(hit[1])
+            continue
+        composite_key = _composite_key(data, keys)
+        code = groups.get(composite_key)
+        if code is None:
+            code = groups[composite_key] = len(firsts)
+            firsts.append(i)
+        by_identity[id(data)] = (data, code)
+        codes.append(code)
+    return codes, firsts
+
+
+def group_by_keys(
+    events: List[Event], keys: Sequence[str], aggregations: Sequence[str] = ()
+) -> List[Event]:
+    """
+    Groups events which share the values for the keys and returns an event for
+    each group, with the summed duration of the group and the timestamp and key
+    values of its first event.
+
+    Additional aggregations (see ``AGGREGATIONS``) are stored in the data of the
+    resulting events, such as ``$count`` for the number of events in the group.
+    Durations are given in seconds and timestamps in ISO 8601.
+
+    Events with a value missing for a key are grouped by the remaining keys.
+    """
+    unknown = [agg for agg in aggregations if agg not in AGGREGATIONS]
+    if unknown:
+        raise ValueError(f"Unknown aggregations: {unknown}")
+    if len(keys) < 1:
+        return events
+
+    batch = EventBatch.from_events(events)
+    codes, firsts = _group_codes(batch.data, keys)
+    starts, ends = batch.starts, batch.ends
+    n_groups = len(firsts)
+
+    sums = [0] * n_groups
+    for g, start, end in zip(codes, starts, ends):
+        sums[g] += end - start
+
+    aggregated: Dict[str, list] = {}
+    if "count" in aggregations:
+        counts = Counter(codes)
+        aggregated["count"] = [counts[g] for g in range(n_groups)]
+    if "min_duration" in aggregations or "max_duration" in aggregations:
+        mins = [ends[i] - starts[i] for i in firsts]
+        maxs = list(mins)
+        for g, start, end in zip(codes, starts, ends):
+            duration = end - start
+            if duration < mins[g]:
+                mins[g] = duration
+            elif duration > maxs[g]:
+                maxs[g] = duration
+        aggregated["min_duration"] = [us / 1e6 for us in mins]
+        aggregated["max_duration"] = [us / 1e6 for us in maxs]
+    if "first_timestamp" in aggregations or "last_timestamp" in aggregations:
+        firsts_ts = [starts[i] for i in firsts]
+        lasts_ts = list(firsts_ts)
+        for g, start in zip(codes, starts):
+            if start < firsts_ts[g]:
+                firsts_ts[g] = start
+            elif start > lasts_ts[g]:
+                lasts_ts[g] = start
+        aggregated["first_timestamp"] = [
+            us_to_timestamp(us).isoformat() for us in firsts_ts
+        ]
+        aggregated["last_timestamp"] = [
+            us_to_timestamp(us).isoformat() for us in lasts_ts
+        ]
+
+    result = []
+    for g, i in enumerate(firsts):
+        first_data = batch.data[i]
+        data = {key: first_data[key] for key in keys if key in first_data}
+        for agg in aggregations:
+            data["$" + agg] = aggregated[agg][g]
+        result.append(
+            Event.from_normalized(
+                None,
+                us_to_timestamp(starts[i]),
+                timedelta(microseconds=sums[g]),
+                data,
+            )
+        )
+    return result
@@ -1,28 +1,14 @@
 import logging
 from datetime import timedelta
-from typing import List, Optional
+from typing import Optional
 
+from aw_core.heartbeats import NEGATIVE_DURATION_WARNING
+from aw_core.heartbeats import heartbeat_reduce, iter_heartbeat_reduce  # noqa: F401
 from aw_core.models import Event
 
 logger = logging.getLogger(__name__)
 
 
-def heartbeat_reduce(events: List[Event], pulsetime: float) -> List[Event]:
-    """Merges consecutive events together according to the rules of `heartbeat_merge`."""
-    reduced = []
-    if events:
-        reduced.append(events.pop(0))
-    for heartbeat in events:
-        merged = heartbeat_merge(reduced[-1], heartbeat, pulsetime)
-        if merged is not None:
-            # Heartbeat was merged
-            reduced[-1] = merged
-        else:
-            # Heartbeat was not merged
-            reduced.append(heartbeat)
-    return reduced
-
-
 def heartbeat_merge(
     last_event: Event, heartbeat: Event, pulsetime: float
 ) -> Optional[Event]:
@@ -45,9 +31,7 @@ def heartbeat_merge(
                 heartbeat.timestamp - last_event.timestamp
             ) + heartbeat.duration
             if last_event.duration < timedelta(0):
-                logger.warning(
-                    "Merging heartbeats would result in a negative duration, refusing to merge."
-                )
+                logger.warning(NEGATIVE_DURATION_WARNING)
             else:
                 # Taking the max of durations ensures heartbeats that end before the last event don't shorten it
                 last_event.duration = max((last_event.duration, new_duration))
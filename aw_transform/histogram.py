@@ -0,0 +1,181 @@
+import re
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from aw_core.models import Event, EventBatch, timestamp_to_us, us_to_timestamp
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    # Python 3.8
+    ZoneInfo = None  # type: ignore
+
+BIN_SIZES = ("hour", "day", "week")
+
+_TD_1H_US = 3600 * 1000000
+
+_OFFSET_RE = re.compile(r"^([+-])(\d\d):?(\d\d)$")
+
+TimeZone = Union[None, str, timedelta, tzinfo]
+
+
+def parse_tz(tz: TimeZone) -> tzinfo:
+    """
+    Returns a tzinfo for a timezone given as a tzinfo, an offset from UTC (as a
+    timedelta or a string like "+02:00") or an IANA timezone name.
+    Defaults to UTC.
+    """
+    if tz is None:
+        return timezone.utc
+    elif isinstance(tz, tzinfo):
+        return tz
+    elif isinstance(tz, timedelta):
+        return timezone(tz)
+    elif tz in ("Z", "UTC"):
+        return timezone.utc
+    match = _OFFSET_RE.match(tz)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes))
+        return timezone(-offset if sign == "-" else offset)
+    if ZoneInfo is None:
+        raise ValueError(f"Timezone names require Python 3.9 or later: {tz}")
+    try:
+        return ZoneInfo(tz)
+    except (ValueError, LookupError) as e:
+        raise ValueError(f"Unknown timezone: {tz}") from e
+
+
+def bin_boundaries(start: int, end: int, bin_size: str, tz: tzinfo) -> List[int]:
+    """
+    Returns the boundaries (in microseconds) of the bins covering ``[start, end]``,
+    the first being at or before ``start`` and the last after ``end``.
+
+    Days and weeks (starting on Mondays) begin at midnight local time, so they
+    are shorter or longer across daylight saving time transitions.
+    """
+    if bin_size not in BIN_SIZES:
+        raise ValueError(f"Invalid bin size '{bin_size}', must be one of {BIN_SIZES}")
+    local = us_to_timestamp(start).astimezone(tz)
+    boundaries: List[int] = []
+    if bin_size == "hour":
+        # Hours are the same length everywhere, so step in absolute time
+        b = timestamp_to_us(local.replace(minute=0, second=0, microsecond=0))
+        while True:
+            boundaries.append(b)
+            if b > end:
+                return boundaries
+            b += _TD_1H_US
+    step = timedelta(days=7 if bin_size == "week" else 1)
+    day = datetime(local.year, local.month, local.day)
+    if bin_size == "week":
+        day -= timedelta(days=day.weekday())
+    while True:
+        b = timestamp_to_us(day.replace(tzinfo=tz))
+        if not boundaries or b > boundaries[-1]:
+            boundaries.append(b)
+            if b > end:
+                return boundaries
+        day += step
+
+
+def histogram_columns(
+    starts: Sequence[int],
+    ends: Sequence[int],
+    values: Optional[Sequence[Any]],
+    bin_size: str = "hour",
+    tz: TimeZone = None,
+    key: Optional[str] = None,
+    starttime: Optional[datetime] = None,
+    endtime: Optional[datetime] = None,
+) -> List[Event]:
+    """
+    Same as :func:`histogram`, for events given as columns of start and end
+    times (in microseconds) and the value for the key of each event (or
+    ``None`` if it's missing), such as returned by storages.
+    """
+    tz = parse_tz(tz)
+    range_start = timestamp_to_us(starttime) if starttime else None
+    range_end = timestamp_to_us(endtime) if endtime else None
+    if not len(starts):
+        return []
+    lo = min(starts) if range_start is None else range_start
+    hi = max(ends) if range_end is None else range_end
+    boundaries = bin_boundaries(lo, hi, bin_size, tz)
+
+    groups: Dict[Hashable, int] = {}
+    group_values: List[Any] = []
+    totals: Dict[Tuple[int, int], int] = {}
+    # Going through the events in order of time makes the order of the values
+    # in the result independent of the order of the events
+    for n in sorted(range(len(starts)), key=starts.__getitem__):
+        start, end = starts[n], ends[n]
+        if range_start is not None and start < range_start:
+            start = range_start
+        if range_end is not None and end > range_end:
+            end = range_end
+        if start >= end:
+            continue
+        group = 0
+        if key is not None:
+            val = values[n]  # type: ignore
+            # Needed for when the value is a list, such as for categories
+            hashable = tuple(val) if isinstance(val, list) else val
+            group = groups.get(hashable, -1)
+            if group < 0:
+                group = groups[hashable] = len(group_values)
+                group_values.append(val)
+        i = bisect_right(boundaries, start) - 1
+        # Split the event at the bin boundaries it crosses
+        while start < end:
+            seg_end = min(end, boundaries[i + 1])
+            totals[(i, group)] = totals.get((i, group), 0) + seg_end - start
+            start = seg_end
+            i += 1
+
+    result = []
+    for i, group in sorted(totals):
+        data = {}
+        if key is not None and group_values[group] is not None:
+            data[key] = group_values[group]
+        result.append(
+            Event.from_normalized(
+                None,
+                us_to_timestamp(boundaries[i]),
+                timedelta(microseconds=totals[(i, group)]),
+                data,
+            )
+        )
+    return result
+
+
+def histogram(
+    events: List[Event],
+    bin_size: str = "hour",
+    tz: TimeZone = None,
+    key: Optional[str] = None,
+    starttime: Optional[datetime] = None,
+    endtime: Optional[datetime] = None,
+) -> List[Event]:
+    """
+    Sums the duration of events within each hour, day or week, splitting events
+    at the bin boundaries, and returns an event for each non-empty bin with the
+    start of the bin as timestamp and the summed duration as duration.
+
+    If a key is given, the durations are summed separately for each value of
+    it, stored in the data of the resulting events (events without the key are
+    summed together, with empty data).
+
+    Bins start at whole hours, midnights or Mondays in the timezone ``tz`` (see
+    :func:`parse_tz`), and events are clipped to ``starttime`` and ``endtime``.
+    The result is sorted by timestamp, then by when each value first occurs.
+
+    Usage:
+      hours = histogram(events, "hour", "Europe/Stockholm", "app")
+    """
+    batch = EventBatch.from_events(events)
+    values = [data.get(key) for data in batch.data] if key is not None else None
+    return histogram_columns(
+        batch.starts, batch.ends, values, bin_size, tz, key, starttime, endtime
+    )
@@ -0,0 +1,197 @@
+"""
+Interval algebra on integer (e.g. microsecond) start/end columns.
+
+Intervals are given as two parallel sequences of starts and ends, sorted by
+start, and every function does a single linear sweep over its input.
+"""
+
+import logging
+from itertools import count
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+Intervals = Tuple[List[int], List[int]]
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+def _intersection(s1: int, e1: int, s2: int, e2: int) -> Optional[Tuple[int, int]]:
+    """Same as ``Timeslot.intersection``, on integers"""
+    if s1 <= s2 and e2 <= e1:
+        return s2, e2
+    elif s1 <= s2 < e1:
+        return s2, e1
+    elif s1 < e2 <= e1:
+        return s1, e2
+    elif s2 <= s1 and e1 <= e2:
+        return s1, e1
+    return None
+
+
+def intersecting_pairs(
+    starts1: Sequence[int],
+    ends1: Sequence[int],
+    starts2: Sequence[int],
+    ends2: Sequence[int],
+) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Yields ``(i, j, start, end)`` for each pair of intersecting intervals from
+    two lists, along with their intersection.
+
+    The intervals within each list may overlap each other.
+    """
+    return iter_intersecting(zip(starts1, ends1, count()), zip(starts2, ends2, count()))
+
+
+def iter_intersecting(
+    intervals1: Iterable[Tuple[int, int, T]], intervals2: Iterable[Tuple[int, int, U]]
+) -> Iterator[Tuple[T, U, int, int]]:
+    """
+    Same as :func:`intersecting_pairs`, for two iterables of ``(start, end, item)``
+    sorted by start, yielding the items of each intersecting pair instead of
+    their indices. Only one interval of each iterable is held at a time.
+    """
+    it1, it2 = iter(intervals1), iter(intervals2)
+    cur1, cur2 = next(it1, None), next(it2, None)
+    while cur1 is not None and cur2 is not None:
+        s1, e1, item1 = cur1
+        s2, e2, item2 = cur2
+        ip = _intersection(s1, e1, s2, e2)
+        if ip:
+            yield item1, item2, ip[0], ip[1]
+            if e1 <= e2:
+                cur1 = next(it1, None)
+            else:
+                cur2 = next(it2, None)
+        elif e1 <= s2:
+            # Interval 1 ended before interval 2 started
+            cur1 = next(it1, None)
+        elif e2 <= s1:
+            # Interval 1 started after interval 2 ended
+            cur2 = next(it2, None)
+        else:
+            logger.error("Should be unreachable, skipping period")
+            cur1, cur2 = next(it1, None), next(it2, None)
+
+
+def check_sorted(
+    intervals: Iterable[Tuple[int, int, T]],
+) -> Iterator[Tuple[int, int, T]]:
+    """
+    Passes through an iterable of ``(start, end, item)``, raising a ValueError
+    if it isn't sorted by start.
+    """
+    last = None
+    for interval in intervals:
+        if last is not None and interval[0] < last:
+            raise ValueError("Intervals must be sorted by start")
+        last = interval[0]
+        yield interval
+
+
+def union_groups(
+    starts: Sequence[int], ends: Sequence[int]
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields ``(i, start, end)`` for each group of intervals without any gap
+    between them (touching intervals are merged), where ``i`` is the index of
+    the first interval in the group.
+    """
+    if not len(starts):
+        return
+    first, cur_start, cur_end = 0, starts[0], ends[0]
+    for i in range(1, len(starts)):
+        s, e = starts[i], ends[i]
+        if cur_end < s or e < cur_start:
+            yield first, cur_start, cur_end
+            first, cur_start, cur_end = i, s, e
+        else:
+            cur_start = min(cur_start, s)
+            cur_end = max(cur_end, e)
+    yield first, cur_start, cur_end
+
+
+def interval_union(starts: Sequence[int], ends: Sequence[int]) -> Intervals:
+    """Returns the union of intervals as a sorted list of disjoint intervals"""
+    union_starts: List[int] = []
+    union_ends: List[int] = []
+    for _, start, end in union_groups(starts, ends):
+        union_starts.append(start)
+        union_ends.append(end)
+    return union_starts, union_ends
+
+
+def interval_intersection(
+    starts1: Sequence[int],
+    ends1: Sequence[int],
+    starts2: Sequence[int],
+    ends2: Sequence[int],
+) -> Intervals:
+    """
+    Returns the intersection of two sets of intervals.
+
+    Both sets must be disjoint and sorted, such as returned by :func:`interval_union`.
+    """
+    out_starts: List[int] = []
+    out_ends: List[int] = []
+    i = 0
+    j = 0
+    while i < len(starts1) and j < len(starts2):
+        start = max(starts1[i], starts2[j])
+        end = min(ends1[i], ends2[j])
+        if start < end:
+            out_starts.append(start)
+            out_ends.append(end)
+        if ends1[i] <= ends2[j]:
+            i += 1
+        else:
+            j += 1
+    return out_starts, out_ends
+
+
+def interval_difference(
+    starts1: Sequence[int],
+    ends1: Sequence[int],
+    starts2: Sequence[int],
+    ends2: Sequence[int],
+) -> Intervals:
+    """
+    Returns the parts of the first set of intervals not covered by the second.
+
+    Both sets must be disjoint and sorted, such as returned by :func:`interval_union`.
+    """
+    out_starts: List[int] = []
+    out_ends: List[int] = []
+    j = 0
+    n2 = len(starts2)
+    for start, end in zip(starts1, ends1):
+        # Skip intervals which end before this one starts
+        while j < n2 and ends2[j] <= start:
+            j += 1
+        cur = start
+        k = j
+        while k < n2 and starts2[k] < end:
+            if starts2[k] > cur:
+                out_starts.append(cur)
+                out_ends.append(starts2[k])
+            cur = max(cur, ends2[k])
+            if cur >= end:
+                break
+            k += 1
+        if cur < end:
+            out_starts.append(cur)
+            out_ends.append(end)
+    return out_starts, out_ends
+
+
+def interval_complement(
+    starts: Sequence[int], ends: Sequence[int], start: int, end: int
+) -> Intervals:
+    """
+    Returns the gaps between intervals within ``[start, end)``.
+
+    The intervals must be disjoint and sorted, such as returned by :func:`interval_union`.
+    """
+    return interval_difference([start], [end], starts, ends)
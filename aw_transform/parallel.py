@@ -0,0 +1,121 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from aw_core.models import CompactEvent, Event, EventBatch
+
+logger = logging.getLogger(__name__)
+
+# Below this number of events the overhead of the process pool isn't worth it
+PARALLEL_THRESHOLD = 20000
+# Number of chunks given to each process, so slow chunks can be evened out
+CHUNKS_PER_PROCESS = 4
+
+Transform = Callable[..., List[Event]]
+
+# The pool is shared between calls, as starting worker processes is costly
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_processes = 0
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # Forking a process which runs threads (such as aw-server) isn't safe
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    global _pool, _pool_processes
+    with _pool_lock:
+        if _pool is None or _pool_processes != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=_mp_context())
+            _pool_processes = processes
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stops the worker processes used by :func:`parallel_map`, if any"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _map_chunk(func: Transform, batch: EventBatch, args: Tuple[Any, ...]) -> EventBatch:
+    return EventBatch.from_events(func(batch.to_events(), *args))
+
+
+def parallel_map(
+    func: Transform,
+    events: Sequence[Event],
+    *args: Any,
+    processes: Optional[int] = None,
+    threshold: int = PARALLEL_THRESHOLD,
+) -> List[Event]:
+    """
+    Runs a transform which handles each event independently, such as
+    ``categorize`` or ``split_url_events``, over chunks of the events in a
+    process pool and concatenates the results in order.
+
+    The transform and the extra arguments are passed to the worker processes,
+    so they need to be picklable (lambdas are not). Events are sent and
+    returned as an ``EventBatch`` per chunk, which only keeps the id,
+    timestamp, duration and data of each event, so any other keys are lost.
+
+    The worker processes are started once (with the forkserver or spawn
+    method) and reused by later calls, see :func:`shutdown_pool`.
+
+    Runs the transform directly if there are fewer events than ``threshold``,
+    or if running it in the process pool fails.
+
+    Usage:
+      events = parallel_map(categorize, events, classes)
+    """
+    processes = processes or os.cpu_count() or 1
+    if len(events) < threshold or processes <= 1:
+        return func(events, *args)
+
+    n_chunks = processes * CHUNKS_PER_PROCESS
+    chunk_size = -(-len(events) // n_chunks)
+    batches = [
+        EventBatch.from_events(events[i : i + chunk_size])
+        for i in range(0, len(events), chunk_size)
+    ]
+    try:
+        pool = _get_pool(processes)
+        results = list(
+            pool.map(
+                _map_chunk,
+                [func] * len(batches),
+                batches,
+                [args] * len(batches),
+            )
+        )
+    except Exception as e:
+        # Such as a worker dying or an argument which can't be pickled. Errors
+        # raised by the transform itself are raised again by the serial run.
+        logger.warning(
+            f"Running transform in process pool failed, running serially: {e}"
+        )
+        if isinstance(e, BrokenProcessPool):
+            shutdown_pool()
+        return func(events, *args)
+
+    compact = all(isinstance(e, CompactEvent) for e in events)
+    out: List[Event] = []
+    for batch in results:
+        out.extend(batch.to_compact() if compact else batch.to_events())  # type: ignore
+    return out
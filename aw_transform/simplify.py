@@ -1,30 +1,94 @@
 import re
-from copy import deepcopy
-from typing import List
+from copy import copy
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Pattern, Sequence, Tuple
 
 from aw_core import Event
 
+# Max number of distinct strings to remember the simplified version of, per set of rules
+SIMPLIFY_CACHE_SIZE = 8192
 
-def simplify_string(events: List[Event], key: str = "title") -> List[Event]:
-    events = deepcopy(events)
+# Rules are (regex, replacement) pairs, applied in order with re.sub
+Rules = Tuple[Tuple[str, str], ...]
 
-    re_leadingdot = re.compile(r"^(●|\*)\s*")
-    re_parensprefix = re.compile(r"^\([0-9]+\)\s*")
-    re_fps = re.compile(r"FPS:\s+[0-9\.]+")
+# Remove prefixes that are numbers within parenthesis
+# Example: "(2) Facebook" -> "Facebook"
+# Example: "(1) YouTube" -> "YouTube"
+_PARENS_PREFIX = (r"^\([0-9]+\)\s*", "")
 
+# Remove FPS display in window title
+# Example: "Cemu - FPS: 59.2 - ..." -> "Cemu - FPS: ... - ..."
+_FPS = (r"FPS:\s+[0-9\.]+", "FPS: ...")
+
+# For VSCode (uses ●), gedit (uses *), et al
+# See: https://github.com/ActivityWatch/aw-watcher-window/issues/32
+_LEADING_DOT = (r"^(●|\*)\s*", "")
+
+
+class _Pipeline:
+    """Compiled rules, with the results memoised per input string"""
+
+    def __init__(self, rules: Rules) -> None:
+        self.rules: List[Tuple[Pattern, str]] = [
+            (re.compile(regex), replacement) for regex, replacement in rules
+        ]
+        self.apply = lru_cache(maxsize=SIMPLIFY_CACHE_SIZE)(self._apply)
+
+    def _apply(self, s: str) -> str:
+        for regex, replacement in self.rules:
+            s = regex.sub(replacement, s)
+        return s
+
+
+@lru_cache(maxsize=16)
+def _pipeline(rules: Rules) -> _Pipeline:
+    return _Pipeline(rules)
+
+
+def iter_simplify_string(
+    events: Iterable[Event],
+    key: str = "title",
+    rules: Optional[Sequence[Sequence[str]]] = None,
+) -> Iterator[Event]:
+    """Generator version of :func:`simplify_string`"""
+    extra_rules: Rules = tuple(
+        (regex, replacement) for regex, replacement in rules or []
+    )
+    default = _pipeline((_PARENS_PREFIX,) + extra_rules)
+    # Things generally specific to window events with the "app" key
+    window = (
+        _pipeline((_PARENS_PREFIX, _FPS, _LEADING_DOT) + extra_rules)
+        if key == "title"
+        else default
+    )
+    return _iter_simplified(events, key, default, window)
+
+
+def _iter_simplified(
+    events: Iterable[Event], key: str, default: _Pipeline, window: _Pipeline
+) -> Iterator[Event]:
     for e in events:
-        # Remove prefixes that are numbers within parenthesis
-        # Example: "(2) Facebook" -> "Facebook"
-        # Example: "(1) YouTube" -> "YouTube"
-        e.data[key] = re_parensprefix.sub("", e.data[key])
-
-        # Things generally specific to window events with the "app" key
-        if key == "title" and "app" in e["data"]:
-            # Remove FPS display in window title
-            # Example: "Cemu - FPS: 59.2 - ..." -> "Cemu - FPS: ... - ..."
-            e.data[key] = re_fps.sub("FPS: ...", e.data[key])
-
-            # For VSCode (uses ●), gedit (uses *), et al
-            # See: https://github.com/ActivityWatch/aw-watcher-window/issues/32
-            e.data[key] = re_leadingdot.sub("", e.data[key])
-    return events
+        value = e.data.get(key)
+        if isinstance(value, str):
+            pipeline = window if "app" in e.data else default
+            s = pipeline.apply(value)
+            if s != value:
+                e = copy(e)
+                e.data = {**e.data, key: s}
+        yield e
+
+
+def simplify_string(
+    events: List[Event],
+    key: str = "title",
+    rules: Optional[Sequence[Sequence[str]]] = None,
+) -> List[Event]:
+    """
+    Simplifies the value for a key, such as by removing notification counts
+    like "(2) " from the start of window titles.
+
+    Additional rules can be given as ``(regex, replacement)`` pairs, which are
+    applied after the built-in ones with ``re.sub``. Events without a string
+    value for the key are left as-is.
+    """
+    return list(iter_simplify_string(events, key, rules))
@@ -1,28 +1,99 @@
+import heapq
 import logging
+import operator
 from datetime import timedelta
-from typing import List
-from aw_core.models import Event
+from itertools import islice
+from typing import Any, Callable, List
+from aw_core.models import Event, CompactEvent, SortedEvents
 
 logger = logging.getLogger(__name__)
 
 
+def _all_compact(events) -> bool:
+    return all(type(e) is CompactEvent for e in events)
+
+
+def _sorted_by(events) -> str:
+    return events.sorted_by if isinstance(events, SortedEvents) else ""
+
+
+def _timestamp_key(events) -> Callable[[Any], Any]:
+    if _all_compact(events):
+        return operator.attrgetter("start_us")
+    return operator.attrgetter("timestamp")
+
+
+def _duration_key(events) -> Callable[[Any], Any]:
+    if _all_compact(events):
+        return operator.attrgetter("duration_us")
+    return operator.attrgetter("duration")
+
+
+def _in_order(keys: List[Any], descending: bool = False) -> bool:
+    """Checks in a single pass that the keys are sorted, allowing equal keys"""
+    compare = operator.ge if descending else operator.le
+    return all(map(compare, keys, islice(keys, 1, None)))
+
+
 def sort_by_timestamp(events) -> List[Event]:
-    """Sorts a list of events by timestamp"""
-    return sorted(events, key=lambda e: e.timestamp)
+    """
+    Sorts a list of events by timestamp
+
+    Events marked as sorted by timestamp (see :class:`aw_core.models.SortedEvents`)
+    are only checked to be in order rather than sorted again. Events in
+    descending order, such as from storage, are left to the sort, which
+    reverses them in linear time.
+    """
+    sorted_by = _sorted_by(events)
+    events = list(events)
+    key = _timestamp_key(events)
+    if sorted_by == "timestamp":
+        if _in_order(list(map(key, events))):
+            return SortedEvents(events, "timestamp")
+        logger.warning("Events marked as sorted weren't, sorting them")
+    return SortedEvents(sorted(events, key=key), "timestamp")
 
 
 def sort_by_duration(events) -> List[Event]:
     """Sorts a list of events by duration"""
-    return sorted(events, key=lambda e: e.duration, reverse=True)
+    sorted_by = _sorted_by(events)
+    events = list(events)
+    key = _duration_key(events)
+    if sorted_by == "-duration":
+        if _in_order(list(map(key, events)), descending=True):
+            return SortedEvents(events, "-duration")
+        logger.warning("Events marked as sorted weren't, sorting them")
+    return SortedEvents(sorted(events, key=key, reverse=True), "-duration")
+
+
+def top_by_duration(events, count) -> List[Event]:
+    """
+    Returns the ``count`` longest events, longest first.
+
+    Same as ``limit_events(sort_by_duration(events), count)``, without sorting
+    all the events.
+    """
+    if _sorted_by(events) == "-duration" or count < 0:
+        return limit_events(sort_by_duration(events), count)
+    events = list(events)
+    return SortedEvents(
+        heapq.nlargest(count, events, key=_duration_key(events)), "-duration"
+    )
 
 
 def limit_events(events, count) -> List[Event]:
     """Returns the ``count`` first events in the list of events"""
+    sorted_by = _sorted_by(events)
+    if sorted_by:
+        return SortedEvents(events[:count], sorted_by)
     return events[:count]
 
 
 def sum_durations(events) -> timedelta:
     """Sums the durations for the given events"""
+    events = list(events)
+    if _all_compact(events):
+        return timedelta(microseconds=sum(event.duration_us for event in events))
     return timedelta(seconds=(sum(event.duration.total_seconds() for event in events)))
 
 
@@ -1,5 +1,7 @@
 import logging
-from typing import List
+from copy import copy
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 
 from urllib.parse import urlparse
 
@@ -7,21 +9,65 @@ from aw_core.models import Event
 
 logger = logging.getLogger(__name__)
 
+# Max number of distinct URLs to keep parsed
+URL_CACHE_SIZE = 8192
 
-def split_url_events(events: List[Event]) -> List[Event]:
+URL_FIELDS = ("$protocol", "$domain", "$path", "$params", "$options", "$identifier")
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def _parse_url(url: str) -> Dict[str, str]:
+    """Returns the fields split from the url (the result is shared, so don't modify it)"""
+    parsed_url = urlparse(url)
+    return {
+        "$protocol": parsed_url.scheme,
+        "$domain": (
+            parsed_url.netloc[4:]
+            if parsed_url.netloc[:4] == "www."
+            else parsed_url.netloc
+        ),
+        "$path": parsed_url.path,
+        "$params": parsed_url.params,
+        "$options": parsed_url.query,
+        "$identifier": parsed_url.fragment,
+        # TODO: Parse user, port etc aswell
+    }
+
+
+def iter_split_url_events(
+    events: Iterable[Event], fields: Optional[Sequence[str]] = None
+) -> Iterator[Event]:
+    """Generator version of :func:`split_url_events`"""
+    if fields is not None:
+        unknown = [field for field in fields if field not in URL_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown url fields: {unknown}")
+    return _iter_split_url_events(events, fields)
+
+
+def _iter_split_url_events(
+    events: Iterable[Event], fields: Optional[Sequence[str]]
+) -> Iterator[Event]:
     for event in events:
         if "url" in event.data:
-            url = event.data["url"]
-            parsed_url = urlparse(url)
-            event.data["$protocol"] = parsed_url.scheme
-            event.data["$domain"] = (
-                parsed_url.netloc[4:]
-                if parsed_url.netloc[:4] == "www."
-                else parsed_url.netloc
-            )
-            event.data["$path"] = parsed_url.path
-            event.data["$params"] = parsed_url.params
-            event.data["$options"] = parsed_url.query
-            event.data["$identifier"] = parsed_url.fragment
-            # TODO: Parse user, port etc aswell
-    return events
+            parsed = _parse_url(event.data["url"])
+            event = copy(event)
+            if fields is None:
+                event.data = {**event.data, **parsed}
+            else:
+                event.data = dict(event.data)
+                for field in fields:
+                    event.data[field] = parsed[field]
+        yield event
+
+
+def split_url_events(
+    events: List[Event], fields: Optional[Sequence[str]] = None
+) -> List[Event]:
+    """
+    Splits the url of events into its parts, stored in the keys listed in
+    ``URL_FIELDS`` (such as ``$domain``).
+
+    If ``fields`` is given, only those keys are added.
+    """
+    return list(iter_split_url_events(events, fields))
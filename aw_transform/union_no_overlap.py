@@ -2,19 +2,20 @@
 Originally from aw-research
 """
 
-from copy import deepcopy
+from copy import copy
+from functools import reduce
 from typing import List, Tuple, Optional
 from datetime import datetime, timedelta, timezone
 
-from timeslot import Timeslot
+from aw_core.models import Event, EventBatch
 
-from aw_core import Event
+from .filter_period_intersect import _replace_event_period
 
 
 def _split_event(e: Event, dt: datetime) -> Tuple[Event, Optional[Event]]:
     if e.timestamp < dt < e.timestamp + e.duration:
-        e1 = deepcopy(e)
-        e2 = deepcopy(e)
+        e1 = copy(e)
+        e2 = copy(e)
         e1.duration = dt - e.timestamp
         e2.timestamp = dt
         e2.duration = (e.timestamp + e.duration) - dt
@@ -35,51 +36,88 @@ def test_split_event():
     assert e2.duration == td1h
 
 
-def union_no_overlap(events1: List[Event], events2: List[Event]) -> List[Event]:
-    """Merges two eventlists and removes overlap, the first eventlist will have precedence
+def _overlaps(s1: int, e1: int, s2: int, e2: int) -> bool:
+    """Same as ``Timeslot.overlaps``, on integers"""
+    return s1 <= s2 < e1 or s1 < e2 <= e1 or (s2 <= s1 and e1 <= e2)
 
-    Example:
-      events1  | xxx    xx     xxx     |
-      events1  |  ----     ------   -- |
-      result   | xxx--  xx ----xxx  -- |
-    """
-    events1 = deepcopy(events1)
-    events2 = deepcopy(events2)
 
-    # I looked a lot at aw_transform.union when I wrote this
+def _union_no_overlap_2(events1: List[Event], events2: List[Event]) -> List[Event]:
+    b1 = EventBatch.from_events(events1)
+    b2 = EventBatch.from_events(events2)
+    starts1, ends1, starts2, ends2 = b1.starts, b1.ends, b2.starts, b2.ends
+    n1 = len(events1)
+    n2 = len(events2)
+
+    # The current event from events2 is kept in a "pending" slot, since it
+    # gets replaced by the remaining part when split by an event from events1
     events_union = []
     e1_i = 0
     e2_i = 0
-    while e1_i < len(events1) and e2_i < len(events2):
+    if n2:
+        e2, e2_start, e2_end = events2[0], starts2[0], ends2[0]
+    while e1_i < n1 and e2_i < n2:
         e1 = events1[e1_i]
-        e2 = events2[e2_i]
-        e1_p = Timeslot(e1.timestamp, e1.timestamp + e1.duration)
-        e2_p = Timeslot(e2.timestamp, e2.timestamp + e2.duration)
+        e1_start, e1_end = starts1[e1_i], ends1[e1_i]
+        next_e2 = False
 
-        if e1_p.intersects(e2_p):
-            if e1.timestamp <= e2.timestamp:
+        if _overlaps(e1_start, e1_end, e2_start, e2_end):
+            if e1_start <= e2_start:
                 events_union.append(e1)
                 e1_i += 1
 
                 # If e2 continues after e1, we need to split up the event so we only get the part that comes after
-                _, e2_next = _split_event(e2, e1.timestamp + e1.duration)
-                if e2_next:
-                    events2[e2_i] = e2_next
+                if e2_start < e1_end < e2_end:
+                    e2, e2_start, e2_end = _split_off(e2, e1_end, e2_end)
                 else:
-                    e2_i += 1
-            else:
-                e2_next, e2_next2 = _split_event(e2, e1.timestamp)
-                events_union.append(e2_next)
-                e2_i += 1
-                if e2_next2:
-                    events2.insert(e2_i, e2_next2)
-        else:
-            if e1.timestamp <= e2.timestamp:
-                events_union.append(e1)
-                e1_i += 1
+                    next_e2 = True
+            elif e2_start < e1_start < e2_end:
+                # Keep the part of e2 before e1, and continue with the rest
+                events_union.append(_replace_event_period(e2, e2_start, e1_start))
+                e2, e2_start, e2_end = _split_off(e2, e1_start, e2_end)
             else:
                 events_union.append(e2)
-                e2_i += 1
+                next_e2 = True
+        elif e1_start <= e2_start:
+            events_union.append(e1)
+            e1_i += 1
+        else:
+            events_union.append(e2)
+            next_e2 = True
+
+        if next_e2:
+            e2_i += 1
+            if e2_i < n2:
+                e2, e2_start, e2_end = events2[e2_i], starts2[e2_i], ends2[e2_i]
     events_union += events1[e1_i:]
-    events_union += events2[e2_i:]
+    if e2_i < n2:
+        events_union.append(e2)
+        events_union += events2[e2_i + 1 :]
     return events_union
+
+
+def _split_off(e: Event, dt: int, end: int) -> Tuple[Event, int, int]:
+    """Returns the part of an event after dt, along with its start and end"""
+    e = _replace_event_period(e, dt, end)
+    # Like the timestamp setter, the start is truncated to milliseconds
+    start = dt - dt % 1000
+    return e, start, start + (end - dt)
+
+
+def union_no_overlap(
+    events1: List[Event], events2: List[Event], *more_events: List[Event]
+) -> List[Event]:
+    """Merges two eventlists and removes overlap, the first eventlist will have precedence
+
+    Any number of eventlists can be given, each having precedence over the ones
+    after it, which is the same as merging them one at a time from the left.
+
+    Example:
+      events1  | xxx    xx     xxx     |
+      events1  |  ----     ------   -- |
+      result   | xxx--  xx ----xxx  -- |
+    """
+    # Each list is merged into the union of the lists before it, which have
+    # precedence over it
+    return reduce(
+        _union_no_overlap_2, more_events, _union_no_overlap_2(events1, events2)
+    )
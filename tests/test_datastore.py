@@ -4,8 +4,10 @@ from datetime import datetime, timedelta, timezone
 
 import iso8601
 import pytest
-from aw_core.models import Event
-from aw_datastore import get_storage_methods
+from aw_core.models import Event, timestamp_to_us
+from aw_datastore import Datastore, get_storage_methods
+from aw_datastore.storages import MemoryStorage
+from aw_transform import sort_by_timestamp
 
 from . import context  # noqa: F401
 from .utils import param_datastore_objects, param_testing_buckets_cm
@@ -138,6 +140,31 @@ def test_insert_many(bucket_cm):
             assert e == fe
 
 
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_insert_many_heartbeats(bucket_cm):
+    """
+    Tests that heartbeats can be merged when inserting many events
+    """
+    with bucket_cm as bucket:
+        events = [
+            Event(timestamp=now + i * td1s, duration=td1s, data={"key": "val"})
+            for i in range(100)
+        ]
+        events.append(
+            Event(timestamp=now + 200 * td1s, duration=td1s, data={"key": "val"})
+        )
+        bucket.insert(events, heartbeat_pulsetime=5)
+        fetched_events = bucket.get(limit=-1)
+        assert len(fetched_events) == 2
+        assert fetched_events[1].timestamp == events[0].timestamp
+        assert fetched_events[1].duration == 100 * td1s
+        assert fetched_events[0].duration == td1s
+
+        # A single event can't be merged with the events already stored
+        with pytest.raises(ValueError):
+            bucket.insert(events[0], heartbeat_pulsetime=5)
+
+
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
 def test_insert_many_upsert(bucket_cm):
     """
@@ -189,6 +216,29 @@ def test_delete(bucket_cm):
         assert num_events - 1 == len(fetched_events)
 
 
+def test_memory_max_duration():
+    """
+    The longest duration in a memory bucket should go back down when the
+    longest event is deleted or replaced, so range queries stay narrow
+    """
+    ds = Datastore(storage_strategy=MemoryStorage, testing=True)
+    bucket = ds.create_bucket("test-max-duration", "test", "test", "test")
+    bucket_events = ds.storage_strategy.db["test-max-duration"]
+    bucket.insert([Event(timestamp=now + i * td1s, duration=td1s) for i in range(10)])
+    long_event = bucket.insert(Event(timestamp=now, duration=td1d))
+    assert bucket_events.max_duration == td1d // timedelta(microseconds=1)
+
+    replaced = Event(id=long_event.id, timestamp=now, duration=2 * td1s)
+    bucket.replace(long_event.id, replaced)
+    assert bucket_events.max_duration == 2 * 1000000
+    assert bucket.delete(long_event.id)
+    assert bucket_events.max_duration == 1000000
+
+    fetched = bucket.get(starttime=now + 5 * td1s, endtime=now + 20 * td1s)
+    assert len(fetched) == 6
+    ds.delete_bucket("test-max-duration")
+
+
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
 def test_insert_badtype(bucket_cm):
     """
@@ -222,6 +272,25 @@ def test_get_ordered(bucket_cm):
             assert fetched_events[i].timestamp > fetched_events[i + 1].timestamp
 
 
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_get_sort_by_timestamp(bucket_cm):
+    """
+    Sorting fetched events by timestamp should give the same result whether
+    or not the storage marks them as sorted
+    """
+    with bucket_cm as bucket:
+        events = [
+            Event(timestamp=now + (i // 3) * td1s, duration=(i % 4) * td1s)
+            for i in range(30)
+        ]
+        random.shuffle(events)
+        bucket.insert(events)
+        fetched_events = bucket.get(-1)
+        assert sort_by_timestamp(fetched_events) == sorted(
+            list(fetched_events), key=lambda e: e.timestamp
+        )
+
+
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
 def test_get_event_with_timezone(bucket_cm):
     """Tries to retrieve an event using a timezone aware datetime."""
@@ -334,10 +403,10 @@ def test_get_event_trimming(bucket_cm):
     """Test that event trimming works correctly (when querying events that intersect with the query range)"""
     # TODO: Trimming should be possible to disable
     # (needed in raw data view, among other places where event editing is permitted)
-    from aw_datastore.storages import PeeweeStorage
+    from aw_datastore.storages import PeeweeStorage, SqliteStorage
 
     with bucket_cm as bucket:
-        if not isinstance(bucket.ds.storage_strategy, PeeweeStorage):
+        if not isinstance(bucket.ds.storage_strategy, (PeeweeStorage, SqliteStorage)):
             pytest.skip("Trimming not supported for datastore")
 
         eventcount = 2
@@ -356,6 +425,10 @@ def test_get_event_trimming(bucket_cm):
         assert 2 == len(fetched_events)
         total_duration = sum((e.duration for e in fetched_events), timedelta())
         assert td1d == timedelta(seconds=round(total_duration.total_seconds()))
+        # Only the start of the first event should have been trimmed
+        stored_events = bucket.get(-1)
+        assert fetched_events[0].timestamp == stored_events[0].timestamp
+        assert fetched_events[-1].timestamp == stored_events[-1].timestamp + td1d / 2
 
 
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
@@ -418,6 +491,71 @@ def test_get_datefilter_both(bucket_cm):
                 assert j - i + 1 == len(fetched_events)
 
 
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_get_datefilter_long_event(bucket_cm):
+    """
+    Tests that events lasting longer than a day are found by ranges only covering their end
+    """
+    with bucket_cm as bucket:
+        bucket.insert(Event(timestamp=now - 3 * td1d, duration=3 * td1d))
+        fetched_events = bucket.get(-1, starttime=now - td1s, endtime=now + td1s)
+        assert 1 == len(fetched_events)
+
+
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_get_batch(bucket_cm):
+    """
+    Tests that get_batch returns the same events as get
+    """
+    with bucket_cm as bucket:
+        bucket.insert(
+            [
+                Event(timestamp=now + i * td1s, duration=td1s, data={"i": i % 3})
+                for i in range(10)
+            ]
+        )
+        kwargs = dict(limit=5, starttime=now + 2.5 * td1s, endtime=now + 20 * td1s)
+        batch = bucket.get_batch(**kwargs)
+        events = bucket.get(**kwargs)
+        assert len(batch) == 5
+        assert batch.to_events() == events
+        assert batch.ids == [e.id for e in events]
+
+
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_get_periods(bucket_cm):
+    """
+    Tests that get_periods returns the same times and values as get
+    """
+    values = ["a", 1, 1.5, True, None, ["x", "y"], {"z": 1}]
+    with bucket_cm as bucket:
+        bucket.insert(
+            [
+                Event(
+                    timestamp=now + i * td1s,
+                    duration=td1s,
+                    data={"v": values[i % len(values)]} if i % 8 else {},
+                )
+                for i in range(20)
+            ]
+        )
+        starts, ends, vals = bucket.get_periods(key="v")
+        periods = sorted(zip(starts, ends, map(repr, vals)))
+        assert periods == sorted(
+            (
+                timestamp_to_us(e.timestamp),
+                timestamp_to_us(e.timestamp + e.duration),
+                repr(e.data.get("v")),
+            )
+            for e in bucket.get()
+        )
+
+        kwargs = dict(starttime=now + 2.5 * td1s, endtime=now + 12.5 * td1s)
+        starts, ends, vals = bucket.get_periods(**kwargs)
+        assert len(starts) == len(ends) == len(bucket.get(**kwargs))
+        assert vals is None
+
+
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
 def test_insert_invalid(bucket_cm):
     with bucket_cm as bucket:
@@ -459,6 +597,26 @@ def test_replace(bucket_cm):
         assert bucket.get(-1)[2]["data"]["label"] == "test1-replaced"
 
 
+@pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
+def test_replace_reorders(bucket_cm):
+    """
+    Tests that replacing an event with a new timestamp moves it in the result order
+    """
+    with bucket_cm as bucket:
+        e1 = bucket.insert(Event(data={"label": "test1"}, timestamp=now))
+        assert e1
+        bucket.insert(Event(data={"label": "test2"}, timestamp=now + td1s))
+        bucket.insert(Event(data={"label": "test3"}, timestamp=now + 2 * td1s))
+
+        e1.timestamp = now + 3 * td1s
+        bucket.replace(e1.id, e1)
+
+        result = bucket.get(-1)
+        assert [e.data["label"] for e in result] == ["test1", "test3", "test2"]
+        assert len(bucket.get(-1, starttime=now + 2.5 * td1s)) == 1
+        assert bucket.get_by_id(e1.id) == e1
+
+
 @pytest.mark.parametrize("bucket_cm", param_testing_buckets_cm())
 def test_replace_last(bucket_cm):
     """
@@ -584,3 +742,111 @@ def test_get_eventcount(bucket_cm):
         )
         assert bucket.get_eventcount(endtime=now + timedelta(seconds=1)) == 5
         assert bucket.get_eventcount(starttime=now + timedelta(seconds=1)) == 1
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_sqlite_interned_payloads(tmp_path, compression):
+    """
+    Tests that interned (and compressed) payloads are stored once and decoded transparently
+    """
+    from aw_datastore.storages import SqliteStorage
+
+    filepath = str(tmp_path / "interned.db")
+    ds = Datastore(
+        SqliteStorage,
+        testing=True,
+        filepath=filepath,
+        intern_payloads=True,
+        compression=compression,
+    )
+    bucket = ds.create_bucket("test-interned", "test", "test", "test")
+    events = [
+        Event(timestamp=now + i * td1s, duration=td1s, data={"title": f"t{i % 3}"})
+        for i in range(30)
+    ]
+    bucket.insert(events[:-1])
+    bucket.insert(events[-1])
+
+    fetched_events = bucket.get(limit=-1)
+    assert len(fetched_events) == len(events)
+    for e, fe in zip(reversed(events), fetched_events):
+        assert e == fe
+    conn = ds.storage_strategy.conn
+    assert conn.execute("SELECT count(*) FROM payloads").fetchone()[0] == 3
+
+    # Mutating fetched data must not leak into later reads
+    fetched_events[0].data["title"] = "changed"
+    assert bucket.get(limit=1)[0].data["title"] == events[-1].data["title"]
+
+    # Payloads left unused by replacing or deleting events are removed
+    def count_payloads():
+        return conn.execute("SELECT count(*) FROM payloads").fetchone()[0]
+
+    once = Event(timestamp=now + 30 * td1s, duration=td1s, data={"title": "once"})
+    bucket.insert(once)
+    assert count_payloads() == 4
+    bucket.replace_last(Event(timestamp=once.timestamp, data={"title": "t0"}))
+    assert count_payloads() == 3
+    last = bucket.get(limit=1)[0]
+    bucket.replace(last.id, once)
+    assert count_payloads() == 4
+    bucket.delete(last.id)
+    assert count_payloads() == 3
+    # The removed payload is stored anew rather than referenced by its old id
+    bucket.insert(once)
+    assert bucket.get(limit=1)[0].data == {"title": "once"}
+    assert count_payloads() == 4
+    bucket.delete(bucket.get(limit=1)[0].id)
+    ds.storage_strategy.commit()
+
+    # Rows written in the inline format stay readable, and vice versa
+    ds_inline = Datastore(SqliteStorage, testing=True, filepath=filepath)
+    ds_inline["test-interned"].insert(
+        Event(timestamp=now + 60 * td1s, duration=td1s, data={"title": "inline"})
+    )
+    assert len(ds_inline["test-interned"].get(limit=-1)) == len(events) + 1
+    assert bucket.get(limit=1)[0].data["title"] == "inline"
+    _, _, titles = bucket.get_periods(key="title")
+    assert sorted(titles) == sorted(e.data["title"] for e in bucket.get(limit=-1))
+
+    ds.delete_bucket("test-interned")
+    assert conn.execute("SELECT count(*) FROM payloads").fetchone()[0] == 0
+
+
+def test_peewee_endtime_migration(tmp_path):
+    """
+    Tests that auto_migrate adds and backfills the endtime column of older peewee databases
+    """
+    import sqlite3
+
+    from aw_datastore.storages.peewee import auto_migrate
+
+    filepath = str(tmp_path / "peewee-old.db")
+    conn = sqlite3.connect(filepath)
+    conn.execute(
+        'CREATE TABLE "bucketmodel" ("key" INTEGER NOT NULL PRIMARY KEY, "id" VARCHAR(255) NOT NULL, "created" DATETIME NOT NULL, "name" VARCHAR(255), "type" VARCHAR(255) NOT NULL, "client" VARCHAR(255) NOT NULL, "hostname" VARCHAR(255) NOT NULL)'
+    )
+    conn.execute(
+        'CREATE TABLE "eventmodel" ("id" INTEGER NOT NULL PRIMARY KEY, "bucket_id" INTEGER NOT NULL, "timestamp" DATETIME NOT NULL, "duration" DECIMAL(10, 5) NOT NULL, "datastr" VARCHAR(255) NOT NULL)'
+    )
+    conn.executemany(
+        "INSERT INTO eventmodel(bucket_id, timestamp, duration, datastr) VALUES (1, ?, ?, '{}')",
+        [
+            ("2021-06-20 12:00:00+00:00", 1.5),
+            ("2021-06-20 12:00:00.250000+00:00", 36 * 60 * 60),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    auto_migrate(filepath)
+
+    conn = sqlite3.connect(filepath)
+    rows = conn.execute("SELECT endtime FROM eventmodel ORDER BY id").fetchall()
+    assert rows == [
+        ("2021-06-20 12:00:01.500000+00:00",),
+        ("2021-06-22 00:00:00.250000+00:00",),
+    ]
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list(eventmodel)")]
+    assert "eventmodel_bucket_id_endtime" in indexes
+    conn.close()
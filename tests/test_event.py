@@ -3,7 +3,15 @@ import json
 
 import pytest
 
-from aw_core.models import Event
+from aw_core import models
+from aw_core.models import (
+    Event,
+    CompactEvent,
+    EventBatch,
+    events_to_json,
+    timestamp_to_us,
+    us_to_timestamp,
+)
 
 valid_timestamp = "1937-01-01T12:00:27.87+00:20"
 
@@ -39,3 +47,117 @@ def test_sort() -> None:
     e_sorted = sorted([e2, e1])
     assert e_sorted[0] == e1
     assert e_sorted[1] == e2
+
+
+def test_from_normalized() -> None:
+    ts = datetime(2020, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    e = Event.from_normalized(1, ts, td1s, {"key": "val"})
+    assert e == Event(id=1, timestamp=ts, duration=td1s, data={"key": "val"})
+    assert e.id == 1
+
+    # Values not in normalized form go through the regular constructor
+    tz = timezone(timedelta(hours=2))
+    e = Event.from_normalized(None, ts.astimezone(tz), 1, {})
+    assert e.timestamp.tzinfo == timezone.utc
+    assert e.duration == td1s
+    e = Event.from_normalized(None, ts.replace(microsecond=123456), td1s, {})
+    assert e.timestamp == ts
+
+
+def test_compact_event() -> None:
+    e = Event(id=1, timestamp=now, duration=td1s, data={"key": "val"})
+    c = CompactEvent.from_event(e)
+    assert c.start_us == timestamp_to_us(e.timestamp)
+    assert c.duration_us == 1000000
+    assert c.timestamp == e.timestamp
+    assert c.duration == e.duration
+    assert c["data"] == {"key": "val"}
+    assert c == e and e == c
+    assert c.to_event() == e
+    assert c.to_event().id == 1
+    assert us_to_timestamp(c.end_us) == e.timestamp + td1s
+
+    c.timestamp = now + td1s
+    c.duration = 2.5
+    assert c.timestamp == e.timestamp + td1s
+    assert c.duration == timedelta(seconds=2.5)
+    assert sorted([c, e]) == [e, c]
+    assert json.loads(c.to_json_str())["duration"] == 2.5
+
+
+def test_event_batch() -> None:
+    events = [
+        Event(id=i, timestamp=now + i * td1s, duration=td1s, data={"i": i % 2})
+        for i in range(4)
+    ]
+    batch = EventBatch.from_events(events)
+    assert len(batch) == 4
+    assert batch.starts[1] - batch.starts[0] == 1000000
+    assert list(batch.durations) == [1000000] * 4
+    assert batch.to_events() == events
+    assert [e.id for e in batch.to_events()] == [0, 1, 2, 3]
+    assert EventBatch.from_events(batch.to_compact()).to_events() == events
+
+    codes, uniques = batch.intern_data()
+    assert codes == [0, 1, 0, 1]
+    assert uniques == [{"i": 0}, {"i": 1}]
+
+    with pytest.raises(ValueError):
+        EventBatch(ids=[1], starts=[0], ends=[], data=[{}])
+
+
+def test_timestamp_parse() -> None:
+    expected = datetime(2020, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    for ts in [
+        "2020-01-01T12:00:00.123456+00:00",
+        "2020-01-01T12:00:00.123Z",
+        "2020-01-01T14:00:00.123+02:00",
+        # No timezone, assumed to be UTC
+        "2020-01-01T12:00:00.123",
+        # Not supported by datetime.fromisoformat on all Python versions
+        "20200101T120000.123Z",
+    ]:
+        e = Event(timestamp=ts)
+        assert e.timestamp == expected, ts
+        assert e.timestamp.tzinfo is timezone.utc
+
+    e = Event(timestamp=valid_timestamp)
+    assert e.timestamp == datetime(1937, 1, 1, 11, 40, 27, 870000, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_events_to_json(monkeypatch, use_orjson: bool) -> None:
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(models, "orjson", None)
+    shared = {"app": "b", "title": "ü"}
+    events = [
+        Event(id=i, timestamp=now + i * td1s, duration=0.5 * i, data=shared)
+        for i in range(5)
+    ]
+    events.append(Event(id="str-id", timestamp=now, data={"nested": {"a": [1, 2]}}))
+    e_extra = Event(timestamp=now, data={})
+    e_extra["extra"] = True
+    events.append(e_extra)
+    # Non-str keys aren't supported by orjson, so take the fallback
+    events.append(Event(timestamp=now, data={1: "a"}))
+    compact = CompactEvent.from_event(events[1])
+
+    expected = [e.to_json_dict() for e in events + [compact]]
+    assert json.loads(events_to_json(events + [compact])) == json.loads(
+        json.dumps(expected)
+    )
+    # Compare the exact output too, as json.loads gives e.g. 1 == True
+    assert events_to_json(events + [compact]) == json.dumps(
+        expected, separators=(",", ":")
+    ).encode("utf-8")
+    assert json.loads(events_to_json([])) == []
+
+    # Values which are equal but serialize differently, under the same key
+    values = [1, True, 1.0, 0, False, 0.0, -0.0, None, "1"]
+    events = [Event(id=i, timestamp=now, data={"a": v}) for i, v in enumerate(values)]
+    assert events_to_json(events) == json.dumps(
+        [e.to_json_dict() for e in events], separators=(",", ":")
+    ).encode("utf-8")
+    assert [e["data"]["a"] for e in json.loads(events_to_json(events))] == values
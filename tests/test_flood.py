@@ -1,9 +1,12 @@
+import random
+from copy import deepcopy
 from datetime import datetime, timedelta, timezone
 
+import pytest
+
 from aw_core.models import Event
 from aw_transform import flood
 
-
 now = datetime.now(tz=timezone.utc)
 td1s = timedelta(seconds=1)
 
@@ -78,3 +81,59 @@ def test_flood_negative_small_gap_differing_data():
     flooded = flood(events)
     duration = sum((e.duration for e in flooded), timedelta(0))
     assert duration == timedelta(seconds=100 + 99.99)
+
+
+def _flood_reference(events, pulsetime=5):
+    """The original, per-event implementation of flood (without logging)"""
+    events = sorted(deepcopy(events), key=lambda e: e.timestamp)
+    negative_gap_trim_thres = timedelta(seconds=0.1)
+    for e1, e2 in zip(events[:-1], events[1:]):
+        gap = e2.timestamp - (e1.timestamp + e1.duration)
+        if not gap:
+            continue
+        if gap < timedelta(0) and e1.data == e2.data:
+            start = min(e1.timestamp, e2.timestamp)
+            end = max(e1.timestamp + e1.duration, e2.timestamp + e2.duration)
+            e1.timestamp, e1.duration = start, (end - start)
+            e2.timestamp, e2.duration = end, timedelta(0)
+        elif gap < -negative_gap_trim_thres:
+            pass
+        elif -negative_gap_trim_thres < gap <= timedelta(seconds=pulsetime):
+            e2_end = e2.timestamp + e2.duration
+            if e1.duration >= e2.duration:
+                if e1.data == e2.data:
+                    e1.duration = e2_end - e1.timestamp
+                    e2.timestamp = e2_end
+                    e2.duration = timedelta(0)
+                else:
+                    e1.duration = e2.timestamp - e1.timestamp
+            else:
+                if e1.data == e2.data:
+                    e2.timestamp = e1.timestamp
+                    e2.duration = e2_end - e2.timestamp
+                    e1.duration = timedelta(0)
+                else:
+                    e2.timestamp = e1.timestamp + e1.duration
+                    e2.duration = e2_end - e2.timestamp
+    return [e for e in events if e.duration > timedelta(0)]
+
+
+@pytest.mark.parametrize("pulsetime", [0, 0.5, 5])
+def test_flood_reference(pulsetime):
+    rng = random.Random(pulsetime)
+    events = []
+    t = now
+    for i in range(2000):
+        # Gaps around the thresholds, durations with sub-millisecond parts
+        t += timedelta(
+            seconds=rng.choice([0, -0.1, 0.1, pulsetime, rng.uniform(-0.5, 7)])
+        )
+        duration = rng.choice([0, rng.uniform(0, 5), rng.randint(0, 5)])
+        data = rng.choice([{"a": 0}, {"a": 0}, {"b": [1]}, {}])
+        events.append(Event(id=i, timestamp=t, duration=duration, data=dict(data)))
+    rng.shuffle(events)
+
+    expected = _flood_reference(events, pulsetime)
+    flooded = flood(events, pulsetime)
+    assert flooded == expected
+    assert [e.id for e in flooded] == [e.id for e in expected]
@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+import random
+from copy import copy
+from datetime import datetime, timedelta, timezone
 
 from aw_core.models import Event
 from aw_transform import heartbeat_merge, heartbeat_reduce
@@ -82,3 +84,33 @@ def test_heartbeat_reduce_fail():
     ]
     reduced_events = heartbeat_reduce(events, pulsetime=2)
     assert len(reduced_events) == 2
+
+
+def test_heartbeat_reduce_batch():
+    """The batch reducer should give the same result as merging one heartbeat at a time"""
+    rng = random.Random(0)
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    labels = [{"label": "a"}, {"label": "b"}, {"label": ["c"]}, {"label": {"d"}}]
+    events = []
+    for i in range(2000):
+        # Data which is equal but isn't the same object, some of it unhashable
+        data = dict(rng.choice(labels))
+        if isinstance(data["label"], set):
+            data["label"] = set(data["label"])
+        now += timedelta(seconds=rng.choice([0, 0.5, 1, 2, 3]))
+        # Including some negative durations, which are never merged into
+        duration = timedelta(seconds=rng.choice([-1, 0, 0, 1, 2.5, 4]))
+        events.append(Event(id=i, timestamp=now, duration=duration, data=data))
+    original = [copy(e) for e in events]
+
+    expected = [copy(events[0])]
+    for heartbeat in events[1:]:
+        merged = heartbeat_merge(expected[-1], heartbeat, pulsetime=2)
+        if merged is None:
+            expected.append(copy(heartbeat))
+
+    reduced = heartbeat_reduce(events, pulsetime=2)
+    assert reduced == expected
+    assert 1 < len(reduced) < len(events)
+    # The input events are left as they were
+    assert events == original
@@ -277,6 +277,28 @@ def test_query2_function_invalid_types():
     """
 
 
+def test_query2_simplify_window_titles_rules():
+    ds = mock_ds
+    qname = "asd"
+    starttime = iso8601.parse_date("1970-01-01")
+    endtime = iso8601.parse_date("1970-01-02")
+    example_query = """
+        events = [];
+        RETURN = simplify_window_titles(events, "title", [["^x", "y"]]);
+    """
+    assert query(qname, example_query, starttime, endtime, ds) == []
+
+    for rules in ['["^x", "y"]', '[["^x"]]', '[["^x", 1]]', '[[["^x"], "y"]]']:
+        example_query = """
+            events = [];
+            RETURN = simplify_window_titles(events, "title", {});
+        """.format(
+            rules
+        )
+        with pytest.raises(QueryFunctionException):
+            query(qname, example_query, starttime, endtime, ds)
+
+
 def test_query2_function_invalid_argument_count():
     ds = mock_ds
     qname = "asd"
@@ -330,7 +352,10 @@ def test_query2_query_functions(datastore):
     events2 = query_bucket('{bid_escaped}');
     events2 = filter_keyvals(events2, "label", ["test1"]);
     events2 = exclude_keyvals(events2, "label", ["test2"]);
+    excluded = ["test2"];
+    events2 = filter_keyvals_include_exclude(events2, "label", ["test1"], excluded);
     events = filter_period_intersect(events, events2);
+    events = union_no_overlap(events, events2, events);
     events = filter_keyvals_regex(events, "label", ".*");
     events = limit_events(events, 1);
     events = merge_events_by_keys(events, ["label"]);
@@ -431,10 +456,14 @@ def test_query2_test_merged_keys(datastore):
     example_query = """
     bid1 = "{bid}";
     events = query_bucket(bid1);
+    aggregations = ["count", "last_timestamp"];
+    grouped = group_by_keys(events, ["label1"], aggregations);
+    hist = histogram(events, "hour", "+01:00", "label2");
+    bucket_hist = query_bucket_histogram(bid1, "hour", "+01:00", "label2");
     events = merge_events_by_keys(events, ["label1", "label2"]);
     events = sort_by_duration(events);
     eventcount = query_bucket_eventcount(bid1);
-    RETURN = {{"events": events, "eventcount": eventcount}};
+    RETURN = {{"events": events, "eventcount": eventcount, "grouped": grouped, "hist": hist, "bucket_hist": bucket_hist}};
     """.format(
         bid=bid
     )
@@ -474,6 +503,18 @@ def test_query2_test_merged_keys(datastore):
         assert result["events"][1]["data"]["label1"] == "test1"
         assert result["events"][1]["data"]["label2"] == "test2"
         assert result["events"][1]["duration"] == timedelta(seconds=1)
+        assert len(result["grouped"]) == 1
+        assert result["grouped"][0]["duration"] == timedelta(seconds=3)
+        assert result["grouped"][0]["data"] == {
+            "label1": "test1",
+            "$count": 3,
+            "$last_timestamp": e3.timestamp.isoformat(),
+        }
+        assert [(e.duration, e.data) for e in result["hist"]] == [
+            (timedelta(seconds=2), {"label2": "test1"}),
+            (timedelta(seconds=1), {"label2": "test2"}),
+        ]
+        assert result["bucket_hist"] == result["hist"]
     finally:
         datastore.delete_bucket(bid)
 
@@ -573,3 +614,48 @@ def test_query2_query_categorize(datastore):
         assert result["events_by_cat"][1].duration == timedelta(seconds=2)
     finally:
         datastore.delete_bucket(bid)
+
+
+@pytest.mark.parametrize("datastore", param_datastore_objects())
+def test_query2_heartbeat_reduce(datastore):
+    bid = "test_bucket"
+    qname = "test"
+    starttime = iso8601.parse_date("1970")
+    endtime = starttime + timedelta(hours=1)
+
+    example_query = """
+    events = sort_by_timestamp(query_bucket("{bid}"));
+    RETURN = {{"reduced": heartbeat_reduce(events, 1), "default": heartbeat_reduce(events)}};
+    """.format(
+        bid=bid
+    )
+    try:
+        bucket = datastore.create_bucket(
+            bucket_id=bid, type="test", client="test", hostname="test", name="asd"
+        )
+        events = [
+            Event(
+                data={"label": "a"},
+                timestamp=starttime + timedelta(seconds=offset),
+                duration=timedelta(seconds=1),
+            )
+            for offset in [0, 1, 2, 10]
+        ]
+        events.append(
+            Event(
+                data={"label": "b"},
+                timestamp=starttime + timedelta(seconds=11),
+                duration=timedelta(seconds=1),
+            )
+        )
+        bucket.insert(events)
+        result = query(qname, example_query, starttime, endtime, datastore)
+        assert [e.duration for e in result["reduced"]] == [
+            timedelta(seconds=3),
+            timedelta(seconds=1),
+            timedelta(seconds=1),
+        ]
+        # The default pulsetime of 5 seconds doesn't bridge the gap either
+        assert len(result["default"]) == 3
+    finally:
+        datastore.delete_bucket(bid)
@@ -1,17 +1,28 @@
+import multiprocessing
+import random
+from functools import reduce
 from pprint import pprint
 from datetime import datetime, timedelta, timezone
 
-from aw_core.models import Event
+import pytest
+
+from aw_core.models import Event, CompactEvent, SortedEvents
 from aw_transform import (
     filter_period_intersect,
+    iter_filter_period_intersect,
     filter_keyvals_regex,
     filter_keyvals,
+    filter_keyvals_include_exclude,
     period_union,
     sort_by_timestamp,
     sort_by_duration,
+    top_by_duration,
+    limit_events,
     sum_durations,
     merge_events_by_keys,
+    group_by_keys,
     chunk_events_by_key,
+    iter_chunk_events_by_key,
     split_url_events,
     simplify_string,
     union,
@@ -19,8 +30,30 @@ from aw_transform import (
     categorize,
     tag,
     Rule,
+    flood,
+    heartbeat_reduce,
+    iter_filter_keyvals,
+    iter_filter_keyvals_regex,
+    iter_split_url_events,
+    iter_simplify_string,
+    iter_categorize,
+    iter_tag,
+    iter_heartbeat_reduce,
+    parallel_map,
+    histogram,
 )
+from aw_transform import parallel
+from aw_transform.group_by_keys import AGGREGATIONS
+from aw_transform.classify import Classifier, get_classifier, _pick_category
 from aw_transform.filter_period_intersect import _intersecting_eventpairs
+from aw_transform.union_no_overlap import _split_event
+from aw_transform.intervals import (
+    interval_union,
+    interval_intersection,
+    interval_difference,
+    interval_complement,
+)
+from timeslot import Timeslot
 
 
 def test_simplify_string():
@@ -45,6 +78,22 @@ def test_simplify_string():
     events = [Event(data={"app": "Gedit", "title": "*test.md - gedit"})]
     assert simplify_string(events, "title")[0].data["title"] == "test.md - gedit"
 
+    # Events without the key (or a string value for it) are left as-is
+    events = [Event(data={"app": "Gedit"}), Event(data={"title": None})]
+    assert simplify_string(events, "title") == events
+
+    # Additional rules are applied after the built-in ones
+    rules = [[r" - Mozilla Firefox$", ""], [r"^Inbox \([0-9]+\)", "Inbox"]]
+    events = [
+        Event(data={"app": "Firefox", "title": "(3) Inbox (12) - Mozilla Firefox"}),
+        Event(data={"title": "(3) Inbox (12) - Mozilla Firefox"}),
+    ]
+    assert [e.data["title"] for e in simplify_string(events, rules=rules)] == [
+        "Inbox",
+        "Inbox",
+    ]
+    assert events[0].data["title"] == "(3) Inbox (12) - Mozilla Firefox"
+
 
 def test_filter_keyval():
     labels = ["aa", "cc"]
@@ -58,6 +107,33 @@ def test_filter_keyval():
     assert len(included_events) == 2
     assert len(excluded_events) == 1
 
+    # Unhashable values are compared as well
+    events.append(Event(data={"label": ["dd"]}))
+    assert filter_keyvals(events, "label", [["dd"], "aa"]) == [events[0], events[3]]
+    assert filter_keyvals(events, "label", ["dd"], exclude=True) == events
+
+
+def test_filter_keyvals_include_exclude():
+    events = [
+        Event(data={"label": "aa", "app": "a"}),
+        Event(data={"label": "bb", "app": "b"}),
+        Event(data={"label": "cc", "app": "a"}),
+        Event(data={"app": "a"}),
+    ]
+    include = ["aa", "bb", "cc"]
+    exclude = ["bb", "cc"]
+    expected = filter_keyvals(
+        filter_keyvals(events, "label", include), "label", exclude, exclude=True
+    )
+    assert filter_keyvals_include_exclude(events, "label", include, exclude) == expected
+    assert filter_keyvals_include_exclude(events, "label", include) == events[:3]
+    assert (
+        filter_keyvals_include_exclude(events, "label", exclude=exclude)
+        == filter_keyvals(events, "label", exclude, exclude=True)
+        == [events[0], events[3]]
+    )
+    assert filter_keyvals_include_exclude(events, "label") == events
+
 
 def test_filter_keyval_regex():
     events = [
@@ -217,6 +293,49 @@ def test_sort_by_duration():
     assert events_sorted == events[::-1]
 
 
+def test_sorted_events():
+    rng = random.Random(0)
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    # Plenty of equal timestamps and durations, to check that ties keep their order
+    events = [
+        Event(
+            timestamp=now + timedelta(seconds=rng.randint(0, 50)),
+            duration=timedelta(seconds=rng.randint(0, 20)),
+            data={"i": i},
+        )
+        for i in range(300)
+    ]
+    by_timestamp = sorted(events, key=lambda e: e.timestamp)
+    by_duration = sorted(events, key=lambda e: e.duration, reverse=True)
+
+    # Such as from storage
+    descending = SortedEvents(
+        sorted(events, key=lambda e: e.timestamp, reverse=True), "-timestamp"
+    )
+    assert sort_by_timestamp(descending) == sorted(
+        list(descending), key=lambda e: e.timestamp
+    )
+    ascending = sort_by_timestamp(events)
+    assert ascending == by_timestamp
+    assert ascending.sorted_by == "timestamp"
+    assert sort_by_timestamp(ascending) == by_timestamp
+    # A wrong order is noticed
+    assert sort_by_timestamp(SortedEvents(events, "-timestamp")) == by_timestamp
+    assert sort_by_timestamp(SortedEvents(events, "timestamp")) == by_timestamp
+    assert sort_by_duration(SortedEvents(events, "-duration")) == by_duration
+    assert top_by_duration(SortedEvents(events, "-duration"), 10) == by_duration[:10]
+
+    for count in [0, 1, 10, 299, 300, 1000, -1]:
+        top = top_by_duration(events, count)
+        assert top == by_duration[:count]
+        assert top == limit_events(sort_by_duration(events), count)
+        assert limit_events(top, 5).sorted_by == "-duration"
+        assert top_by_duration(sort_by_duration(events), count) == by_duration[:count]
+
+    with pytest.raises(ValueError):
+        SortedEvents(events, "duration")
+
+
 def test_sum_durations():
     now = datetime.now(timezone.utc)
     events = []
@@ -228,6 +347,28 @@ def test_sum_durations():
     assert result == timedelta(seconds=10)
 
 
+def test_compact_events():
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    td1s = timedelta(seconds=1)
+    events = [
+        Event(timestamp=now + i * td1s, duration=td1s, data={"label": str(i % 2)})
+        for i in range(10)
+    ]
+    compact = [CompactEvent.from_event(e) for e in events]
+
+    assert sort_by_timestamp(compact[::-1]) == events
+    assert sort_by_duration(compact) == sort_by_duration(events)
+    assert sum_durations(compact) == sum_durations(events)
+    assert flood(compact) == flood(events)
+    assert merge_events_by_keys(compact, ["label"]) == merge_events_by_keys(
+        events, ["label"]
+    )
+    filterevents = [Event(timestamp=now + 2.5 * td1s, duration=3 * td1s)]
+    assert filter_period_intersect(compact, filterevents) == filter_period_intersect(
+        events, filterevents
+    )
+
+
 def test_merge_events_by_keys_1():
     now = datetime.now(timezone.utc)
     events = []
@@ -278,6 +419,89 @@ def test_merge_events_by_keys_2():
     assert result[2].duration == timedelta(seconds=8)
 
 
+def test_group_by_keys():
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    td1s = timedelta(seconds=1)
+    events = [
+        Event(
+            timestamp=now + i * td1s,
+            duration=(i + 1) * td1s,
+            data={"label": "b" if i % 3 == 0 else "a", "n": i},
+        )
+        for i in range(10)
+    ]
+    result = group_by_keys(events, ["label"], AGGREGATIONS)
+    assert [e.data["label"] for e in result] == ["b", "a"]
+    b, a = result
+    assert b.timestamp == now
+    assert b.duration == (1 + 4 + 7 + 10) * td1s
+    assert b.data == {
+        "label": "b",
+        "$count": 4,
+        "$min_duration": 1.0,
+        "$max_duration": 10.0,
+        "$first_timestamp": now.isoformat(),
+        "$last_timestamp": (now + 9 * td1s).isoformat(),
+    }
+    assert a.timestamp == now + td1s
+    assert a.duration == sum([2, 3, 5, 6, 8, 9]) * td1s
+    assert a.data["$count"] == 6
+
+    assert result[0].duration == sum_durations(events[::3])
+
+    with pytest.raises(ValueError):
+        group_by_keys(events, ["label"], ["median"])
+
+
+def test_histogram():
+    td30m = timedelta(minutes=30)
+    t = datetime(2021, 1, 6, 10, 30, tzinfo=timezone.utc)
+    events = [
+        Event(timestamp=t, duration=2 * td30m, data={"app": "a"}),
+        Event(timestamp=t + 1.5 * td30m, duration=td30m, data={"app": "b"}),
+        Event(timestamp=t + 2 * td30m, duration=td30m, data={}),
+    ]
+
+    result = histogram(events, "hour", key="app")
+    assert [(e.timestamp, e.duration, e.data) for e in result] == [
+        (t - td30m, td30m, {"app": "a"}),
+        (t + td30m, td30m, {"app": "a"}),
+        (t + td30m, td30m, {"app": "b"}),
+        (t + td30m, td30m, {}),
+    ]
+    # Hours start at half past in a timezone offset by 1.5h
+    result = histogram(events, "hour", "+01:30")
+    assert [(e.timestamp, e.duration) for e in result] == [
+        (t, 2.5 * td30m),
+        (t + 2 * td30m, 1.5 * td30m),
+    ]
+    # Weeks start on Mondays, clipped to the range
+    result = histogram(events, "week", starttime=t + td30m, endtime=t + 3 * td30m)
+    assert [(e.timestamp, e.duration) for e in result] == [
+        (datetime(2021, 1, 4, tzinfo=timezone.utc), 3 * td30m)
+    ]
+    assert histogram([], "day") == []
+    with pytest.raises(ValueError):
+        histogram(events, "minute")
+    with pytest.raises(ValueError):
+        histogram(events, "day", "Not/A_Timezone")
+
+
+def test_histogram_dst():
+    pytest.importorskip("zoneinfo")
+    # Clocks in Sweden moved forward on 2021-03-28, making it 23 hours long
+    t = datetime(2021, 3, 27, 23, tzinfo=timezone.utc)
+    events = [Event(timestamp=t, duration=timedelta(days=1))]
+    result = histogram(events, "day", "Europe/Stockholm")
+    assert [(e.timestamp, e.duration) for e in result] == [
+        (t, timedelta(hours=23)),
+        (t + timedelta(hours=23), timedelta(hours=1)),
+    ]
+    hours = histogram(events, "hour", "Europe/Stockholm")
+    assert len(hours) == 24
+    assert sum_durations(hours) == timedelta(days=1)
+
+
 def test_chunk_events_by_key():
     now = datetime.now(timezone.utc)
     events = []
@@ -307,6 +531,45 @@ def test_chunk_events_by_key():
     assert result[1].data["subevents"][0] == e3
 
 
+def test_chunk_events_by_key_gaps():
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    td1s = timedelta(seconds=1)
+
+    def ev(t, data):
+        return Event(timestamp=now + t * td1s, duration=td1s, data=data)
+
+    events = [
+        ev(0, {"app": "a"}),
+        ev(2, {"app": "a"}),
+        # More than pulsetime after the end of the previous chunk
+        ev(20, {"app": "a"}),
+        # Events without the key are skipped
+        ev(21, {}),
+        ev(22, {"app": "a"}),
+        ev(23, {"app": "b"}),
+    ]
+    result = chunk_events_by_key(events, "app")
+    assert [(e.timestamp, e.duration, e.data["app"]) for e in result] == [
+        (now, 2 * td1s, "a"),
+        (now + 20 * td1s, 2 * td1s, "a"),
+        (now + 23 * td1s, td1s, "b"),
+    ]
+    assert result[1].data["subevents"] == [events[2], events[4]]
+    assert chunk_events_by_key(events, "app", pulsetime=30)[0].duration == 4 * td1s
+
+    summarized = chunk_events_by_key(events, "app", summarize=True)
+    assert [e.data for e in summarized] == [
+        {"app": "a", "$count": 2},
+        {"app": "a", "$count": 2},
+        {"app": "b", "$count": 1},
+    ]
+    assert [e.duration for e in summarized] == [e.duration for e in result]
+
+    # Chunks are yielded as soon as they're complete
+    chunks = iter_chunk_events_by_key(iter(events), "app")
+    assert next(chunks).data["subevents"] == events[:2]
+
+
 def test_url_parse_event():
     now = datetime.now(timezone.utc)
     e = Event(
@@ -351,6 +614,15 @@ def test_url_parse_event():
     assert result[0].data["$options"] == ""
     assert result[0].data["$identifier"] == ""
 
+    result = split_url_events([e2, e2, e3], fields=["$domain"])
+    assert [e.data for e in result] == [
+        {**e2.data, "$domain": "asd.asd.com"},
+        {**e2.data, "$domain": "asd.asd.com"},
+        {**e3.data, "$domain": ""},
+    ]
+    with pytest.raises(ValueError):
+        split_url_events([e], fields=["domain"])
+
 
 def test_union():
     now = datetime.now(timezone.utc)
@@ -423,6 +695,111 @@ def test_tags():
     assert len(events[1].data["$tags"]) == 0
 
 
+def test_classifier_matches_rules():
+    rng = random.Random(7)
+    words = ["just", "a", "test", "value", "Firefox", "vim", "mail", "x"]
+    regexes = words + [
+        "^just",
+        "value$",
+        "fire(fox|bird)",
+        "(a)\\1",
+        "(?P<w>vim)",
+        "(?i)mail",
+        "a.*test",
+        "x*",
+        "",
+        "[",
+    ]
+    rules = []
+    for _ in range(250):
+        regex = rng.choice(regexes)
+        rule = {
+            "regex": regex,
+            "ignore_case": rng.random() < 0.3,
+            "select_keys": rng.choice([None, [], ["app"], ["title"], ["app", "title"]]),
+        }
+        try:
+            rules.append(Rule(rule))
+        except Exception:
+            # Invalid regex
+            continue
+    classifier = Classifier(rules)
+
+    for _ in range(200):
+        data = {
+            key: " ".join(rng.choice(words) for _ in range(rng.randint(0, 4)))
+            for key in ["app", "title", "url"]
+            if rng.random() < 0.8
+        }
+        data["n"] = rng.choice([1, ["vim"], None])
+        e = Event(timestamp=datetime.now(timezone.utc), data=data)
+        expected = [i for i, rule in enumerate(rules) if rule.match(e)]
+        assert list(classifier.matching(e.data)) == expected
+
+        classes = [([str(i)] * (i % 3 + 1), rule) for i, rule in enumerate(rules)]
+        category = categorize([e], classes)[0].data["$category"]
+        assert category == _pick_category(classes[i][0] for i in expected)
+
+
+def test_classifier_cache():
+    def rules():
+        return [Rule({"regex": "^just"}), Rule({"regex": "test", "select_keys": ["a"]})]
+
+    # Identical rule sets share a classifier, and with it the cached matches
+    classifier = get_classifier(rules())
+    assert get_classifier(rules()) is classifier
+    assert get_classifier(rules()[:1]) is not classifier
+    assert get_classifier([Rule({"regex": "^just", "ignore_case": True})]) is not (
+        get_classifier([Rule({"regex": "^just"})])
+    )
+
+    assert classifier.matching({"a": "just a test"}) == (0, 1)
+    assert classifier.matching({"a": "just a test"}) == (0, 1)
+    assert classifier.matching({"b": "just a test"}) == (0,)
+    assert classifier.matching({"a": 1, "b": ["just"]}) == ()
+
+
+def test_parallel_map():
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    events = [
+        Event(
+            id=i,
+            timestamp=now + timedelta(seconds=i),
+            duration=timedelta(seconds=1),
+            data={"url": f"https://example{i % 3}.com/path?q={i}"},
+        )
+        for i in range(100)
+    ]
+    classes = [(["Example"], Rule({"regex": "example1"}))]
+
+    for func, args in [(categorize, (classes,)), (split_url_events, ())]:
+        expected = func(events, *args)
+        assert parallel_map(func, events, *args, processes=2, threshold=10) == expected
+        # Below the threshold it runs in-process
+        assert parallel_map(func, events, *args, processes=2) == expected
+
+    compact = [CompactEvent.from_event(e) for e in events]
+    result = parallel_map(categorize, compact, classes, processes=2, threshold=10)
+    assert all(isinstance(e, CompactEvent) for e in result)
+    assert result == categorize(events, classes)
+
+    # The worker processes are reused between calls
+    assert parallel._get_pool(2) is parallel._get_pool(2)
+
+    # Failing workers fall back to running in-process
+    result = parallel_map(
+        _categorize_in_parent, events, classes, processes=2, threshold=10
+    )
+    assert result == categorize(events, classes)
+    parallel.shutdown_pool()
+
+
+def _categorize_in_parent(events, classes):
+    if multiprocessing.parent_process() is not None:
+        raise RuntimeError("Not running in the parent process")
+    return categorize(events, classes)
+
+
 def test_union_no_overlap():
     from pprint import pprint
 
@@ -459,3 +836,205 @@ def test_union_no_overlap():
     dur = sum((e.duration for e in events_union), timedelta(0))
     assert dur == timedelta(hours=5, minutes=0)
     assert sorted(events_union, key=lambda e: e.timestamp)
+
+
+def test_transforms_dont_modify_input():
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    td1s = timedelta(seconds=1)
+    events = [
+        Event(
+            timestamp=now + 3 * i * td1s,
+            duration=2 * td1s,
+            data={"title": "(1) Test ● " + str(i % 2), "app": "a", "url": "http://a.b"},
+        )
+        for i in range(6)
+    ]
+    events2 = [Event(timestamp=now + td1s, duration=10 * td1s, data={"x": 1})]
+    snapshot = [e.to_json_dict() for e in events + events2]
+
+    flood(events)
+    union_no_overlap(events2, events)
+    simplify_string(events)
+    filter_period_intersect(events, events2)
+    period_union(events, events2)
+    split_url_events(events)
+    categorize(events, [(["Test"], Rule({"regex": "Test"}))])
+    tag(events, [("test", Rule({"regex": "Test"}))])
+    heartbeat_reduce(events, pulsetime=2)
+
+    assert [e.to_json_dict() for e in events + events2] == snapshot
+
+
+def test_iter_transforms():
+    """The generator versions should give the same result as the list versions, lazily"""
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    td1s = timedelta(seconds=1)
+    events = [
+        Event(
+            timestamp=now + i * td1s,
+            duration=td1s if i % 5 else 3 * td1s,
+            data={"title": f"(1) Test {i % 3}", "app": "a", "url": f"http://a.b/{i}"},
+        )
+        for i in range(30)
+    ]
+    classes = [
+        (["Test"], Rule({"regex": "Test"})),
+        (["Test", "1"], Rule({"regex": "1"})),
+    ]
+    pairs = [
+        (filter_keyvals(events, "app", ["a"]), iter_filter_keyvals, ("app", ["a"])),
+        (
+            filter_keyvals_regex(events, "title", "1$"),
+            iter_filter_keyvals_regex,
+            ("title", "1$"),
+        ),
+        (split_url_events(events), iter_split_url_events, ()),
+        (simplify_string(events), iter_simplify_string, ()),
+        (categorize(events, classes), iter_categorize, (classes,)),
+        (tag(events, classes), iter_tag, (classes,)),
+        (heartbeat_reduce(events, 1), iter_heartbeat_reduce, (1,)),
+    ]
+    for expected, iter_func, args in pairs:
+        # Nothing is consumed until the result is iterated
+        it = iter(events)
+        result = iter_func(it, *args)
+        assert len(list(it)) == len(events)
+        assert list(result) == []
+
+        result = iter_func(iter(events), *args)
+        assert next(result) == expected[0]
+        assert [expected[0]] + list(result) == expected
+
+
+def test_interval_algebra():
+    starts, ends = interval_union([0, 5, 10, 30], [10, 8, 20, 40])
+    assert (starts, ends) == ([0, 30], [20, 40])
+
+    assert interval_intersection([0, 30], [20, 40], [15, 35], [32, 50]) == (
+        [15, 30, 35],
+        [20, 32, 40],
+    )
+    assert interval_difference([0, 30], [20, 40], [5, 18, 35], [10, 32, 50]) == (
+        [0, 10, 32],
+        [5, 18, 35],
+    )
+    assert interval_complement([0, 30], [20, 40], -10, 50) == (
+        [-10, 20, 40],
+        [0, 30, 50],
+    )
+    assert interval_complement([], [], 0, 10) == ([0], [10])
+
+
+def test_filter_period_intersect_reference():
+    """Compares against intersecting the periods with Timeslot"""
+    rng = random.Random(0)
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    def random_events(n):
+        return [
+            Event(
+                timestamp=now + timedelta(seconds=rng.randint(0, 1000)),
+                duration=rng.choice([0, rng.randint(1, 100)]),
+                data={"i": i},
+            )
+            for i in range(n)
+        ]
+
+    events = random_events(200)
+    filterevents = sorted(random_events(50))
+    events_before = list(events)
+    filtered = filter_period_intersect(events, filterevents)
+    assert events == events_before
+
+    expected = []
+    sorted_events = sorted(events)
+    e_i = f_i = 0
+    while e_i < len(sorted_events) and f_i < len(filterevents):
+        e, f = sorted_events[e_i], filterevents[f_i]
+        e_p = Timeslot(e.timestamp, e.timestamp + e.duration)
+        f_p = Timeslot(f.timestamp, f.timestamp + f.duration)
+        ip = e_p.intersection(f_p)
+        if ip:
+            expected.append(
+                Event(timestamp=ip.start, duration=ip.duration, data=e.data)
+            )
+            if e_p.end <= f_p.end:
+                e_i += 1
+            else:
+                f_i += 1
+        elif e_p.end <= f_p.start:
+            e_i += 1
+        else:
+            f_i += 1
+    assert filtered == expected
+
+    # The generator version takes both sorted, as iterators
+    assert (
+        list(iter_filter_period_intersect(iter(sorted_events), iter(filterevents)))
+        == expected
+    )
+    if __debug__:
+        with pytest.raises(ValueError):
+            list(iter_filter_period_intersect(events, filterevents))
+
+
+def _union_no_overlap_reference(events1, events2):
+    """The original implementation of union_no_overlap, using list.insert"""
+    events2 = list(events2)
+    events_union = []
+    e1_i = 0
+    e2_i = 0
+    while e1_i < len(events1) and e2_i < len(events2):
+        e1 = events1[e1_i]
+        e2 = events2[e2_i]
+        e1_p = Timeslot(e1.timestamp, e1.timestamp + e1.duration)
+        e2_p = Timeslot(e2.timestamp, e2.timestamp + e2.duration)
+        if e1_p.intersects(e2_p):
+            if e1.timestamp <= e2.timestamp:
+                events_union.append(e1)
+                e1_i += 1
+                _, e2_next = _split_event(e2, e1.timestamp + e1.duration)
+                if e2_next:
+                    events2[e2_i] = e2_next
+                else:
+                    e2_i += 1
+            else:
+                e2_next, e2_next2 = _split_event(e2, e1.timestamp)
+                events_union.append(e2_next)
+                e2_i += 1
+                if e2_next2:
+                    events2.insert(e2_i, e2_next2)
+        else:
+            if e1.timestamp <= e2.timestamp:
+                events_union.append(e1)
+                e1_i += 1
+            else:
+                events_union.append(e2)
+                e2_i += 1
+    events_union += events1[e1_i:]
+    events_union += events2[e2_i:]
+    return events_union
+
+
+def test_union_no_overlap_reference():
+    rng = random.Random(0)
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    def random_events(label):
+        events = []
+        t = now
+        for _ in range(300):
+            t += timedelta(seconds=rng.choice([0, rng.uniform(0, 20)]))
+            duration = timedelta(seconds=rng.choice([0, rng.uniform(0, 20)]))
+            events.append(Event(timestamp=t, duration=duration, data={"l": label}))
+            t += duration
+        return events
+
+    a, b, c, d = [random_events(label) for label in "abcd"]
+    expected = _union_no_overlap_reference(a, b)
+    assert union_no_overlap(a, b) == expected
+
+    # Merging more lists at once gives the same result as merging them one by one
+    for eventlists in [(a, b, c), (a, b, c, d), (d, c, b, a, a)]:
+        expected = reduce(_union_no_overlap_reference, eventlists)
+        assert union_no_overlap(*eventlists) == expected